@@ -1,14 +1,24 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 import hashlib
+import math
+import multiprocessing
+import os
 import secrets
+import threading
+import time
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
 
-from database import get_db
+from database import get_async_read_db, get_db
 from models import User
 
 # ---------- Config ----------
@@ -17,6 +27,20 @@ SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# How auto-created student passwords are provisioned on upload:
+#   "eager"    - hash every roll number in the request thread
+#   "parallel" - hash in batches on a process pool across all cores
+#   "lazy"     - store a pending marker; hash on the student's first login
+PASSWORD_PROVISIONING = os.getenv("PASSWORD_PROVISIONING", "eager")
+# Below this many passwords "parallel" hashes in-process (pool overhead would dominate)
+HASH_BATCH_SIZE = 2000
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+PENDING_PASSWORD = "!pending"
+
+# Authenticated-user cache: entries live at most PRINCIPAL_CACHE_TTL seconds
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+
 # ---------- Password Hashing (SHA-256 + salt) ----------
 
 def hash_password(password: str) -> str:
@@ -25,10 +49,51 @@ def hash_password(password: str) -> str:
     return f"{salt}${hashed}"
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
+    if is_pending_password(hashed_password):
+        return False
     salt, stored_hash = hashed_password.split("$")
     computed = hashlib.sha256((salt + plain_password).encode()).hexdigest()
     return computed == stored_hash
 
+def is_pending_password(hashed_password: str) -> bool:
+    """True if the credential is still waiting to be created on first login."""
+    return hashed_password == PENDING_PASSWORD
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    """The shared hashing pool, started on first use. Spawned, not forked: the server is multi-threaded."""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _hash_pool
+
+def shutdown_hash_pool() -> None:
+    """Stop the hashing workers (app shutdown)."""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hash many passwords, split evenly across the process pool's workers when the list is large."""
+    if len(passwords) < HASH_BATCH_SIZE:
+        return [hash_password(p) for p in passwords]
+    chunksize = math.ceil(len(passwords) / HASH_WORKERS)
+    return list(_get_hash_pool().map(hash_password, passwords, chunksize=chunksize))
+
+def provision_passwords(passwords: list[str], mode: Optional[str] = None) -> list[str]:
+    """Return the stored password column for new student accounts."""
+    mode = mode or PASSWORD_PROVISIONING
+    if mode == "lazy":
+        return [PENDING_PASSWORD] * len(passwords)
+    if mode == "parallel":
+        return hash_passwords(passwords)
+    return [hash_password(p) for p in passwords]
+
 # ---------- JWT ----------
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -37,32 +102,141 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# ---------- Principal Cache ----------
+
+@dataclass(frozen=True)
+class MarksSnapshot:
+    id: int
+    cohort: str
+    student_id: str
+    student_name: str
+    time_study: float
+    marks: float
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Detached view of an authenticated user and their linked marks."""
+    id: int
+    username: str
+    role: str
+    marks: Optional[MarksSnapshot]
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        m = user.marks
+        snapshot = MarksSnapshot(m.id, m.cohort, m.student_id, m.student_name, m.time_study, m.marks) if m else None
+        return cls(user.id, user.username, user.role, snapshot)
+
+
+class PrincipalCache:
+    """Bounded TTL + LRU cache of principals keyed by token subject (username)."""
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, Principal]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(username, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, principal: Principal) -> None:
+        with self._lock:
+            self._entries[principal.username] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def invalidate_students(self, cohort: Optional[str] = None) -> None:
+        """Drop the student principals of ``cohort`` (all students when None), e.g. after an upload."""
+        with self._lock:
+            stale = [
+                u for u, (_, p) in self._entries.items()
+                if p.role == "student" and (cohort is None or p.marks is None or p.marks.cohort == cohort)
+            ]
+            for username in stale:
+                del self._entries[username]
+
+    def info(self) -> dict:
+        return {"size": len(self._entries), "max_size": self.max_size, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+
+principal_cache = PrincipalCache()
+
 # ---------- Current User Dependency ----------
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid or expired token",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _token_subject(token: str) -> str:
+    """Decode the JWT and return its subject (username)."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    return username
+
+def _principal_query(username: str):
+    return select(User).options(joinedload(User.marks)).where(User.username == username)
 
-    user = db.query(User).filter(User.username == username).first()
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Resolve the bearer token to a Principal, from the cache when possible."""
+    username = _token_subject(token)
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    user = db.scalars(_principal_query(username)).first()
+    if user is None:
+        raise _credentials_exception()
+    principal = Principal.from_user(user)
+    principal_cache.put(principal)
+    return principal
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)
+) -> Principal:
+    """Async twin of get_current_user for ``async def`` endpoints."""
+    username = _token_subject(token)
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+
+    user = (await db.scalars(_principal_query(username))).first()
     if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    principal = Principal.from_user(user)
+    principal_cache.put(principal)
+    return principal
 
 # ---------- Role-Based Dependencies ----------
 
-def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+def get_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Only allow admin (teacher) users."""
     if current_user.role != "admin":
         raise HTTPException(
@@ -71,7 +245,7 @@ def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
         )
     return current_user
 
-def get_student_user(current_user: User = Depends(get_current_user)) -> User:
+def get_student_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     """Only allow student users."""
     if current_user.role != "student":
         raise HTTPException(
@@ -0,0 +1,40 @@
+"""Benchmark: bulk ingest throughput (rows/sec) for the shared ingest engine.
+
+Usage: python benchmarks/bench_ingest.py [rows ...]   (default: 1000 100000 1000000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base  # noqa: E402
+from ingest import replace_students  # noqa: E402
+from synthetic import synthetic_frame  # noqa: E402
+
+
+def run(rows: int) -> float:
+    df = synthetic_frame(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        try:
+            start = time.perf_counter()
+            replace_students(db, df)
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+            engine.dispose()
+    return rows / elapsed
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+    print(f"{'rows':>10} {'rows/sec':>12}")
+    for n in sizes:
+        print(f"{n:>10} {run(n):>12,.0f}")
@@ -0,0 +1,109 @@
+"""Cold-start benchmark: how long a fresh process takes to import the app and serve a first request.
+
+Each run is a new interpreter (the import cache is what we measure) with its
+own empty SQLite database and background prewarming disabled:
+
+    import_seconds          ``import main``
+    first_response_seconds  lifespan startup (schema, render pool) + GET /
+
+The median of ``--runs`` is compared with ``--max-import-seconds`` and, with
+``--baseline``, against an earlier ``--output`` report with a relative
+``--tolerance``. Importing the app must not load pandas or matplotlib either.
+The exit status is 1 if any check fails.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--max-import-seconds 1.5]
+        [--output startup.json] [--baseline old_startup.json --tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Loaded on demand (ingest / chart workers); importing the app must not pull them in
+HEAVY_MODULES = ["pandas", "matplotlib", "openpyxl"]
+
+
+def measure() -> dict:
+    """One cold start in this (fresh) process."""
+    sys.path.insert(0, REPO_DIR)
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        resp = client.get("/")
+        first_response_seconds = time.perf_counter() - start
+    if resp.status_code != 200:
+        raise RuntimeError(f"GET / -> {resp.status_code}")
+    return {"import_seconds": import_seconds, "first_response_seconds": first_response_seconds,
+            "heavy_modules": loaded}
+
+
+def _run_worker() -> dict:
+    with tempfile.TemporaryDirectory(prefix="marks-startup-") as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/startup.db", PREWARM_IMPORTS="0")
+        # The app resolves static/ relative to the working directory
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker"],
+                              cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"startup worker failed (exit {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-seconds", type=float, default=1.5)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="earlier --output report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression vs --baseline")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure()))
+        return
+
+    runs = [_run_worker() for _ in range(args.runs)]
+    results = {
+        "import_seconds": statistics.median(r["import_seconds"] for r in runs),
+        "first_response_seconds": statistics.median(r["first_response_seconds"] for r in runs),
+    }
+    heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+
+    failures = []
+    if heavy:
+        failures.append(f"importing the app loaded {', '.join(heavy)}")
+    if results["import_seconds"] > args.max_import_seconds:
+        failures.append(f"import_seconds = {results['import_seconds']:.3f} (max {args.max_import_seconds})")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        for metric, old in baseline.items():
+            limit = old * (1 + args.tolerance)
+            if metric in results and results[metric] > limit:
+                failures.append(f"{metric} = {results[metric]:.3f} (baseline {old:.3f}, limit {limit:.3f})")
+
+    for metric, value in results.items():
+        print(f"{metric:<24}{value:>8.3f} s   (runs: {', '.join(f'{r[metric]:.3f}' for r in runs)})")
+    print(f"{'heavy modules loaded':<24}{', '.join(heavy) or 'none':>8}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "runs": runs, "passed": not failures}, f, indent=2)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
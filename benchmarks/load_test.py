@@ -0,0 +1,114 @@
+"""Load test: latency percentiles for the hot read endpoints under concurrency.
+
+Logs in once per target, then fires ``--requests`` GETs per endpoint with at most
+``--concurrency`` in flight and prints p50/p95/p99 (ms) per endpoint. A login
+storm phase then POSTs ``/auth/login`` cycling through the first ``--students``
+accounts of a synthetic dataset (load one with ``synthetic.write_csv`` first;
+``--students 0`` skips it). Pass several ``--url`` values (e.g. a sync build
+and an async build) to compare them side by side.
+
+Usage:
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 [--url http://127.0.0.1:8001]
+        [--username admin --password admin] [--concurrency 1000] [--requests 5000]
+        [--students 1000] [--report load.json]
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from synthetic import student_credentials
+
+ENDPOINTS = ["/auth/me", "/marks/average", "/marks/?limit=100"]
+LOGIN = "/auth/login"
+
+
+async def _login(client: httpx.AsyncClient, username: str, password: str) -> dict:
+    resp = await client.post("/auth/login", data={"username": username, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+async def _hammer(send, requests: int, concurrency: int) -> dict:
+    """Await ``send(i)`` for i in range(requests), at most ``concurrency`` at a time."""
+    gate = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with gate:
+            start = time.perf_counter()
+            try:
+                resp = await send(i)
+                if resp.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    ms = np.asarray(latencies) * 1000
+    return {
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "rps": requests / elapsed,
+        "errors": errors,
+    }
+
+
+async def run_target(url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        headers = await _login(client, args.username, args.password)
+        results = {
+            path: await _hammer(lambda _, path=path: client.get(path, headers=headers), args.requests, args.concurrency)
+            for path in ENDPOINTS
+        }
+        if args.students:
+            def login(i: int):
+                username, password = student_credentials(i % args.students + 1)
+                return client.post(LOGIN, data={"username": username, "password": password})
+            results[LOGIN] = await _hammer(login, args.requests, args.concurrency)
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", action="append", required=True, help="base URL; repeat to compare builds")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=5000, help="requests per endpoint")
+    parser.add_argument("--students", type=int, default=1000,
+                        help="distinct synthetic student accounts the login phase cycles through (0: skip)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--report", help="also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = {url: asyncio.run(run_target(url, args)) for url in args.url}
+
+    print(f"{'endpoint':<22} {'target':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}")
+    for path in ENDPOINTS + ([LOGIN] if args.students else []):
+        for url, per_path in results.items():
+            r = per_path[path]
+            print(f"{path:<22} {url:<28} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f} {r['rps']:>9.0f} {r['errors']:>7}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({
+                "generated_at": datetime.now(timezone.utc).isoformat(),
+                "config": {"concurrency": args.concurrency, "requests": args.requests, "students": args.students},
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
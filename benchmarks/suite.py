@@ -0,0 +1,227 @@
+"""Benchmark suite: in-process (TestClient) measurements over synthetic datasets.
+
+For each dataset size a fresh worker process gets its own SQLite database,
+uploads a synthetic CSV through /marks/upload and measures:
+
+    ingest_rows_per_sec      upload throughput
+    login_per_sec            student logins per second
+    <endpoint>_cold_ms       first request after the upload (stats rebuild / chart render)
+    <endpoint>_p50_ms/_p95_ms  repeated requests (cached path)
+    peak_rss_mb              peak resident set size of the worker
+
+Results go to a JSON report. Each metric is checked against the absolute
+limits in ``--thresholds`` (per size) and, with ``--baseline``, against an
+earlier report with a relative ``--tolerance``. The exit status is 1 if any
+check fails, so CI can gate on it.
+
+Usage:
+    python benchmarks/suite.py [--sizes 1000 100000 1000000] [--output report.json]
+        [--thresholds benchmarks/thresholds.json] [--baseline old_report.json --tolerance 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_THRESHOLDS = os.path.join(BENCH_DIR, "thresholds.json")
+
+# (metric prefix, path) of the read endpoints timed after the upload
+ENDPOINTS = [
+    ("me", "/auth/me"),
+    ("average", "/marks/average"),
+    ("distribution", "/marks/distribution"),
+    ("top", "/marks/top?k=10"),
+    ("page", "/marks/?limit=100"),
+    ("histogram_data", "/marks/histogram/data"),
+    ("histogram", "/marks/histogram"),
+    ("bar_chart", "/marks/bar-chart"),
+]
+
+
+# ──────────────────────────────────────────────
+#  Worker: one dataset size, one process
+# ──────────────────────────────────────────────
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _timed(client, path: str, headers: dict) -> float:
+    start = time.perf_counter()
+    resp = client.get(path, headers=headers)
+    elapsed = (time.perf_counter() - start) * 1000
+    if resp.status_code != 200:
+        raise RuntimeError(f"GET {path} -> {resp.status_code}: {resp.text[:200]}")
+    return elapsed
+
+
+def measure(rows: int, seed: int, repeat: int, logins: int) -> dict:
+    """Run every measurement for one dataset size in this process."""
+    sys.path.insert(0, REPO_DIR)
+    from synthetic import student_credentials, write_csv
+
+    tmp = tempfile.mkdtemp(prefix="marks-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    csv_path = write_csv(rows, os.path.join(tmp, "students.csv"), seed)
+
+    from fastapi.testclient import TestClient
+    import main
+
+    metrics = {"rows": rows}
+    with TestClient(main.app) as client:
+        client.post("/auth/register", json={"username": "bench", "email": "bench@x", "password": "bench", "role": "admin"})
+        token = client.post("/auth/login", data={"username": "bench", "password": "bench"}).json()["access_token"]
+        admin = {"Authorization": f"Bearer {token}"}
+
+        with open(csv_path, "rb") as f:
+            start = time.perf_counter()
+            resp = client.post("/marks/upload", headers=admin, files={"file": ("students.csv", f, "text/csv")})
+            elapsed = time.perf_counter() - start
+        if resp.status_code != 200:
+            raise RuntimeError(f"upload failed: {resp.status_code} {resp.text[:200]}")
+        metrics["ingest_rows_per_sec"] = rows / elapsed
+
+        picks = np.random.default_rng(seed).integers(1, rows + 1, min(logins, rows))
+        start = time.perf_counter()
+        for i in picks:
+            username, password = student_credentials(int(i))
+            resp = client.post("/auth/login", data={"username": username, "password": password})
+            if resp.status_code != 200:
+                raise RuntimeError(f"login of {username} failed: {resp.status_code}")
+        metrics["login_per_sec"] = len(picks) / (time.perf_counter() - start)
+        student = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        for name, path in ENDPOINTS:
+            headers = student if name == "me" else admin
+            metrics[f"{name}_cold_ms"] = _timed(client, path, headers)
+            warm = [_timed(client, path, headers) for _ in range(repeat)]
+            metrics[f"{name}_p50_ms"] = float(np.percentile(warm, 50))
+            metrics[f"{name}_p95_ms"] = float(np.percentile(warm, 95))
+
+    metrics["peak_rss_mb"] = _peak_rss_mb()
+    shutil.rmtree(tmp, ignore_errors=True)
+    return metrics
+
+
+# ──────────────────────────────────────────────
+#  Driver: run the workers, check limits, write the report
+# ──────────────────────────────────────────────
+def _run_worker(rows: int, args) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(rows),
+           "--seed", str(args.seed), "--repeat", str(args.repeat), "--logins", str(args.logins)]
+    # The app resolves static/ and the default CSV relative to the working directory
+    proc = subprocess.run(cmd, cwd=REPO_DIR, stdout=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"benchmark worker for {rows} rows failed (exit {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith("_per_sec")
+
+
+def check(results: dict, thresholds: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """Compare results with absolute per-size limits and, optionally, a baseline report."""
+    checks = []
+    for size, metrics in results.items():
+        for metric, limit in thresholds.get(size, {}).items():
+            value = metrics.get(metric)
+            if value is None:
+                continue
+            for kind in ("min", "max"):
+                if kind in limit:
+                    ok = value >= limit[kind] if kind == "min" else value <= limit[kind]
+                    checks.append({"size": size, "metric": metric, "value": round(value, 3),
+                                   "limit": limit[kind], "kind": kind, "ok": ok})
+        for metric, old in baseline.get(size, {}).items():
+            value = metrics.get(metric)
+            if metric == "rows" or value is None or not old:
+                continue
+            if _higher_is_better(metric):
+                limit, ok = old * (1 - tolerance), value >= old * (1 - tolerance)
+            else:
+                limit, ok = old * (1 + tolerance), value <= old * (1 + tolerance)
+            checks.append({"size": size, "metric": metric, "value": round(value, 3),
+                           "limit": round(limit, 3), "kind": "baseline", "ok": ok})
+    return checks
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50, help="warm requests per endpoint")
+    parser.add_argument("--logins", type=int, default=200, help="student logins timed per size")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression vs --baseline")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(measure(args.worker, args.seed, args.repeat, args.logins)))
+        return
+
+    results = {}
+    for rows in args.sizes:
+        print(f"benchmarking {rows:,} rows ...", file=sys.stderr)
+        results[str(rows)] = _run_worker(rows, args)
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    checks = check(results, thresholds, baseline, args.tolerance)
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"seed": args.seed, "repeat": args.repeat, "logins": args.logins},
+        "results": results,
+        "checks": checks,
+        "passed": all(c["ok"] for c in checks),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    metrics = sorted({m for r in results.values() for m in r if m != "rows"})
+    print(f"{'metric':<26}" + "".join(f"{size:>14}" for size in results))
+    for metric in metrics:
+        print(f"{metric:<26}" + "".join(f"{results[s].get(metric, float('nan')):>14,.1f}" for s in results))
+    for c in checks:
+        if not c["ok"]:
+            print(f"REGRESSION {c['size']} rows: {c['metric']} = {c['value']} ({c['kind']} {c['limit']})")
+    print(f"report written to {args.output}: {'passed' if report['passed'] else 'FAILED'}")
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Synthetic student datasets in the student_dataset_100_records.csv schema."""
+import numpy as np
+import pandas as pd
+
+
+def synthetic_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Build a DataFrame in the student_dataset_100_records.csv schema."""
+    rng = np.random.default_rng(seed)
+    serial = np.arange(1, rows + 1)
+    return pd.DataFrame({
+        "Serial Number": serial,
+        "Student Name": [f"Student {i}" for i in serial],
+        "Student Roll Number": [f"R{i:07d}" for i in serial],
+        "Marks": rng.integers(0, 101, rows),
+        "Time Studied Per Day (hrs)": rng.uniform(0, 10, rows).round(1),
+    })
+
+
+def student_credentials(i: int) -> tuple[str, str]:
+    """(username, password) of the auto-created account for row ``i`` (1-based) of a synthetic dataset."""
+    roll = f"R{i:07d}"
+    return f"Student {i}_{roll}", roll
+
+
+def write_csv(rows: int, path: str, seed: int = 0) -> str:
+    """Write a synthetic dataset to ``path`` and return the path."""
+    synthetic_frame(rows, seed).to_csv(path, index=False)
+    return path
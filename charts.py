@@ -0,0 +1,321 @@
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from metrics import chart_render_seconds
+
+logger = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────
+#  Renderers: marks -> PNG bytes
+# ──────────────────────────────────────────────
+def _pyplot():
+    """
+    matplotlib is only needed where charts are drawn (the render workers), so
+    it is imported on first use instead of with this module.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _to_png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=150)
+    _pyplot().close(fig)
+    return buf.getvalue()
+
+
+# Above this many students the bar chart switches to per-bucket min/max/mean
+BAR_CHART_MAX_BARS = int(os.getenv("BAR_CHART_MAX_BARS", "500"))
+BAR_CHART_BUCKETS = 200
+
+
+def render_bar_chart(marks) -> bytes:
+    """Bar chart of marks per student; aggregated into buckets for large classes."""
+    marks = np.asarray(marks, dtype=float)
+    if marks.size > BAR_CHART_MAX_BARS:
+        return _render_bar_chart_aggregated(marks)
+
+    indices = list(range(1, len(marks) + 1))
+
+    fig, ax = _pyplot().subplots(figsize=(14, 6))
+    ax.bar(indices, marks, color="steelblue", edgecolor="black")
+    ax.set_title("Student Marks - Bar Chart", fontsize=16, fontweight="bold")
+    ax.set_xlabel("Student Index", fontsize=12)
+    ax.set_ylabel("Marks", fontsize=12)
+    ax.set_xticks(range(1, len(marks) + 1, 5))
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def _render_bar_chart_aggregated(marks: np.ndarray) -> bytes:
+    """Mean bar per bucket of consecutive students with a min-max whisker; cost is O(buckets)."""
+    data = bar_chart_data(marks, BAR_CHART_BUCKETS)
+    size = data["bucket_size"]
+    starts = np.asarray(data["start"])
+    centers = starts + (size - 1) / 2
+
+    fig, ax = _pyplot().subplots(figsize=(14, 6))
+    ax.bar(centers, data["mean"], width=size, color="steelblue", edgecolor="black", linewidth=0.3, label="Mean")
+    ax.vlines(centers, data["min"], data["max"], color="black", linewidth=0.8, label="Min - Max")
+    ax.set_title(
+        f"Student Marks - Bar Chart ({data['total']} students, {size} per bar)",
+        fontsize=16, fontweight="bold",
+    )
+    ax.set_xlabel("Student Index", fontsize=12)
+    ax.set_ylabel("Marks", fontsize=12)
+    ax.set_xlim(0.5, marks.size + 0.5)
+    ax.legend(loc="lower right")
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def render_histogram(marks) -> bytes:
+    """Histogram of the marks distribution."""
+    fig, ax = _pyplot().subplots(figsize=(10, 6))
+    ax.hist(marks, bins=15, color="coral", edgecolor="black", alpha=0.85)
+    ax.set_title("Marks Distribution - Histogram", fontsize=16, fontweight="bold")
+    ax.set_xlabel("Marks", fontsize=12)
+    ax.set_ylabel("Frequency", fontsize=12)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+# ──────────────────────────────────────────────
+#  Chart data: vectorised aggregates for client-side rendering
+# ──────────────────────────────────────────────
+def histogram_data(marks: np.ndarray, bins: int, lo: Optional[float] = None, hi: Optional[float] = None) -> dict:
+    """Bin edges and counts of the marks distribution over [lo, hi] (defaults to the data range)."""
+    lo = float(marks.min()) if lo is None else lo
+    hi = float(marks.max()) if hi is None else hi
+    if hi <= lo:
+        hi = lo + 1.0
+    counts, edges = np.histogram(marks, bins=bins, range=(lo, hi))
+    return {"total": int(marks.size), "edges": edges.round(4).tolist(), "counts": counts.tolist()}
+
+
+def bar_chart_data(marks: np.ndarray, buckets: int) -> dict:
+    """
+    Min/max/mean of consecutive runs of students (in record order), at most
+    ``buckets`` runs. With fewer students than buckets each run is one student.
+    """
+    size = max(1, -(-marks.size // buckets))
+    starts = np.arange(0, marks.size, size)
+    counts = np.diff(np.append(starts, marks.size))
+    means = np.add.reduceat(marks, starts) / counts
+    return {
+        "total": int(marks.size),
+        "bucket_size": int(size),
+        "start": (starts + 1).tolist(),
+        "min": np.minimum.reduceat(marks, starts).tolist(),
+        "max": np.maximum.reduceat(marks, starts).tolist(),
+        "mean": means.round(2).tolist(),
+    }
+
+
+# ──────────────────────────────────────────────
+#  Render pool: matplotlib runs in warm worker processes
+# ──────────────────────────────────────────────
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+# Requests allowed to wait for a render (running, queued or waiting on another
+# request's render of the same chart) before callers get a 503
+CHART_QUEUE_LIMIT = int(os.getenv("CHART_QUEUE_LIMIT", "8"))
+# Longest a request waits for another request's render of the same chart
+CHART_WAIT_TIMEOUT = float(os.getenv("CHART_WAIT_TIMEOUT", "10"))
+CHART_RETRY_AFTER_SECONDS = 2
+
+
+class RenderPoolBusy(Exception):
+    """Raised when the render queue is full; callers should retry later."""
+
+
+def _warm_worker() -> None:
+    """Pool initializer: load matplotlib and its font cache before the first request."""
+    fig, ax = _pyplot().subplots(figsize=(1, 1))
+    ax.bar([1], [1])
+    _to_png(fig)
+
+
+def _noop() -> None:
+    pass
+
+
+class RenderPool:
+    """Process pool of warm matplotlib workers with a bounded admission queue."""
+
+    def __init__(self, workers: int = CHART_WORKERS, queue_limit: int = CHART_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.renders = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        return self._executor
+
+    def busy(self) -> RenderPoolBusy:
+        """Count a rejected request and return the exception to raise."""
+        with self._lock:
+            self.rejected += 1
+        return RenderPoolBusy()
+
+    @contextmanager
+    def admission(self):
+        """Hold one of the ``queue_limit`` slots for the duration of the block, or raise RenderPoolBusy."""
+        with self._lock:
+            full = self.in_flight >= self.queue_limit
+            if not full:
+                self.in_flight += 1
+        if full:
+            raise self.busy()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        """Drop a broken pool (a worker died) so the next render starts a fresh one."""
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def render(self, renderer: Callable[[np.ndarray], bytes], marks: np.ndarray) -> bytes:
+        """Render in a worker process; the caller holds an ``admission`` slot."""
+        with self._lock:
+            pool = self._pool()
+        start = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(pool.submit(renderer, marks))
+        except BrokenProcessPool:
+            logger.warning("chart render worker died; restarting the render pool")
+            self._discard(pool)
+            raise self.busy() from None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.renders += 1
+                self.total_seconds += elapsed
+                self.last_seconds = elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+            chart_render_seconds.observe(elapsed, chart=renderer.__name__)
+
+    def warm(self) -> None:
+        """Start every worker now so the first chart request doesn't pay for process startup."""
+        with self._lock:
+            pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_noop)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def info(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.in_flight,
+            "queue_limit": self.queue_limit,
+            "renders": self.renders,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(1000 * self.total_seconds / self.renders, 1) if self.renders else 0.0,
+            "last_latency_ms": round(1000 * self.last_seconds, 1),
+            "max_latency_ms": round(1000 * self.max_seconds, 1),
+        }
+
+
+render_pool = RenderPool()
+
+
+# ──────────────────────────────────────────────
+#  Versioned PNG cache
+# ──────────────────────────────────────────────
+class ChartCache:
+    """Rendered PNGs with their ETags, keyed by chart name and cohort stats version (event loop only)."""
+
+    def __init__(self, pool: RenderPool, wait_timeout: float = CHART_WAIT_TIMEOUT):
+        self.pool = pool
+        self.wait_timeout = wait_timeout
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._lock_users: dict[str, int] = {}
+        self._entries: dict[str, tuple[int, bytes, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, name: str, version: int) -> Optional[tuple[bytes, str]]:
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1], entry[2]
+        return None
+
+    async def get(self, name: str, version: int, render: Callable[[], Awaitable[bytes]]) -> tuple[bytes, str]:
+        """Return (png, etag) for ``name`` at ``version``, awaiting ``render`` on a miss."""
+        cached = self._cached(name, version)
+        if cached is not None:
+            return cached
+        with self.pool.admission():
+            lock = self._locks.setdefault(name, asyncio.Lock())
+            self._lock_users[name] = self._lock_users.get(name, 0) + 1
+            try:
+                try:
+                    await asyncio.wait_for(lock.acquire(), self.wait_timeout)
+                except asyncio.TimeoutError:
+                    raise self.pool.busy() from None
+                try:
+                    cached = self._cached(name, version)
+                    if cached is not None:
+                        return cached
+                    self.misses += 1
+                    png = await render()
+                    etag = f'"{hashlib.sha1(png).hexdigest()}"'
+                    self._entries[name] = (version, png, etag)
+                    return png, etag
+                finally:
+                    lock.release()
+            finally:
+                self._lock_users[name] -= 1
+                if not self._lock_users[name]:
+                    del self._lock_users[name], self._locks[name]
+
+    def info(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached": {name: entry[0] for name, entry in self._entries.items()},
+            "locks": len(self._locks),
+        }
+
+
+chart_cache = ChartCache(render_pool)
@@ -1,10 +1,113 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./marks.db"
+from metrics import instrument_engine
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./marks.db")
+# Read-only analytics connections; for a SQLite file this defaults to the same file opened with mode=ro
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Applied to every new SQLite connection. WAL lets dashboard reads proceed while an upload holds the write lock.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),    # negative = KiB (64 MiB)
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", "268435456")),   # 256 MiB
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # ms
+    "temp_store": "MEMORY",
+}
+# Pragmas that would write to the database file are skipped on read-only connections
+READ_ONLY_SKIP_PRAGMAS = {"journal_mode"}
+
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    database = make_url(url).database
+    return _is_sqlite(url) and database in (None, "", ":memory:")
+
+
+def _read_only_url(url: str) -> str:
+    """Derive a read-only SQLite URI (file:...?mode=ro) for a file database URL."""
+    if not _is_sqlite(url) or _is_memory_sqlite(url):
+        return url
+    path = make_url(url).database
+    return f"sqlite:///file:{path}?mode=ro&uri=true"
+
+
+def _install_pragmas(sync_engine, read_only: bool) -> None:
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            if read_only and name in READ_ONLY_SKIP_PRAGMAS:
+                continue
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _engine_kwargs(url: str) -> dict:
+    kwargs = {}
+    if _is_sqlite(url):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_sqlite(url):
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return kwargs
+
+
+def _make_engine(url: str, read_only: bool = False):
+    new_engine = create_engine(url, **_engine_kwargs(url))
+    if _is_sqlite(url):
+        _install_pragmas(new_engine, read_only)
+    instrument_engine(new_engine, "read" if read_only else "write")
+    return new_engine
+
+
+def _async_url(url: str) -> str:
+    """Swap the sync SQLite driver for aiosqlite; other URLs must already name an async driver."""
+    parsed = make_url(url)
+    if parsed.drivername in ("sqlite", "sqlite+pysqlite"):
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return url
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+def _make_async_engine(url: str, read_only: bool = False):
+    url = _async_url(url)
+    new_engine = create_async_engine(url, **_engine_kwargs(url))
+    if _is_sqlite(url):
+        _install_pragmas(new_engine.sync_engine, read_only)
+    instrument_engine(new_engine.sync_engine, "async_read" if read_only else "async_write")
+    return new_engine
+
+
+engine = _make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+if READ_DATABASE_URL or not _is_memory_sqlite(DATABASE_URL):
+    read_engine = _make_engine(READ_DATABASE_URL or _read_only_url(DATABASE_URL), read_only=True)
+else:
+    read_engine = engine  # an in-memory database cannot be opened a second time
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Async engines (aiosqlite) for the hot request paths, mirroring the sync pair above
+async_engine = _make_async_engine(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+if read_engine is engine:
+    async_read_engine = async_engine
+else:
+    async_read_engine = _make_async_engine(READ_DATABASE_URL or _read_only_url(DATABASE_URL), read_only=True)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -15,3 +118,24 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Dependency that provides a read-only session for analytics endpoints."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Async dependency that provides an AsyncSession."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """Async dependency that provides a read-only AsyncSession."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,96 @@
+import csv
+import io
+from typing import Iterator, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from database import read_engine
+from models import StudentMark
+
+EXPORT_BATCH_SIZE = 65536
+EXPORT_COLUMNS = ("id", "cohort", "student_id", "student_name", "time_study", "marks")
+
+EXPORT_FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def _row_batches(cohort: Optional[str]) -> Iterator[list[tuple]]:
+    """
+    Read the table in batches of plain driver tuples: the query runs on a DBAPI cursor, so
+    no SQLAlchemy Row is built per record (these column types need no result processing).
+    """
+    query = select(*(getattr(StudentMark, c) for c in EXPORT_COLUMNS)).order_by(StudentMark.id)
+    if cohort is not None:
+        query = query.where(StudentMark.cohort == cohort)
+    sql = str(query.compile(read_engine, compile_kwargs={"literal_binds": True}))
+    with read_engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+def _drain(buf: io.BytesIO) -> bytes:
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return data
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ("id", pa.int64()),
+        ("cohort", pa.string()),
+        ("student_id", pa.string()),
+        ("student_name", pa.string()),
+        ("time_study", pa.float64()),
+        ("marks", pa.float64()),
+    ])
+
+
+def _iter_arrow(parquet: bool, cohort: Optional[str]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(pa)
+    buf = io.BytesIO()
+    writer = pq.ParquetWriter(buf, schema) if parquet else ipc.new_stream(buf, schema)
+    for rows in _row_batches(cohort):
+        writer.write_batch(pa.RecordBatch.from_pydict(dict(zip(EXPORT_COLUMNS, zip(*rows))), schema=schema))
+        yield _drain(buf)
+    writer.close()
+    yield _drain(buf)
+
+
+def _iter_csv(cohort: Optional[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in _row_batches(cohort):
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue().encode()
+
+
+def export_stream(fmt: str, cohort: Optional[str] = None) -> Iterator[bytes]:
+    """Byte stream of the student_marks table (one cohort, or all) in ``fmt`` (arrow, parquet or csv)."""
+    if fmt == "csv":
+        return _iter_csv(cohort)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=501, detail=f"{fmt} export requires the 'pyarrow' package")
+    return _iter_arrow(parquet=fmt == "parquet", cohort=cohort)
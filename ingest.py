@@ -0,0 +1,407 @@
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from auth import principal_cache, provision_passwords
+from metrics import ingest_rows, ingest_rows_per_second, ingest_seconds
+from models import DEFAULT_COHORT, StudentMark, User
+from stats_store import stats_store
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Columns every uploaded sheet must provide
+REQUIRED_COLUMNS = {"Student Name", "Student Roll Number", "Marks", "Time Studied Per Day (hrs)"}
+
+# Rows parsed and inserted per chunk; bounds peak memory regardless of file size
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "10000"))
+
+# Upper bound on credentials (and username conflicts) echoed back in an upload response
+MAX_CREDENTIALS_IN_RESPONSE = 1000
+
+ProgressCallback = Callable[[int, int], None]
+# A whole sheet or an iterable of row chunks
+StudentFrames = Union["pd.DataFrame", Iterable["pd.DataFrame"]]
+
+
+def _pandas():
+    """pandas is imported by the first ingest rather than at startup (see ``preload``)."""
+    import pandas
+    return pandas
+
+
+def preload() -> None:
+    """Import the ingest dependencies ahead of the first upload (called in the background at startup)."""
+    _pandas()
+
+
+def validate_columns(columns, source: str = "File") -> None:
+    """Raise 400 if the uploaded sheet is missing any required column."""
+    if not REQUIRED_COLUMNS.issubset(set(columns)):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{source} must contain columns: {REQUIRED_COLUMNS}. Found: {list(columns)}"
+        )
+
+
+# ──────────────────────────────────────────────
+#  Chunked readers (header validated before any rows are parsed)
+# ──────────────────────────────────────────────
+def _chunk_frame(df: "pd.DataFrame", chunk_size: int) -> Iterator["pd.DataFrame"]:
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def iter_csv_chunks(source, chunk_size: int = INGEST_CHUNK_SIZE, label: str = "CSV") -> Iterator["pd.DataFrame"]:
+    """Validate the CSV header, then return an iterator of row chunks."""
+    header = _pandas().read_csv(source, nrows=0)
+    validate_columns(header.columns, label)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return _pandas().read_csv(source, chunksize=chunk_size)
+
+
+def _file_kind(filename: str) -> str:
+    filename = filename.lower()
+    if filename.endswith(".csv"):
+        return "csv"
+    if filename.endswith((".xlsx", ".xls")):
+        return "excel"
+    raise HTTPException(
+        status_code=400,
+        detail="Unsupported file type. Upload a .csv or .xlsx file."
+    )
+
+
+def validate_file(source, filename: str) -> None:
+    """Check the file type and header of an upload without parsing its rows."""
+    if _file_kind(filename) == "csv":
+        header = _pandas().read_csv(source, nrows=0)
+    else:
+        header = _pandas().read_excel(source, engine="openpyxl", nrows=0)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    validate_columns(header.columns, "File")
+
+
+def iter_file_chunks(source, filename: str, chunk_size: int = INGEST_CHUNK_SIZE) -> Iterator["pd.DataFrame"]:
+    """Return chunks of a CSV or Excel file (path or file object). Excel is parsed whole, then chunked."""
+    if _file_kind(filename) == "csv":
+        return iter_csv_chunks(source, chunk_size, "File")
+    validate_file(source, filename)
+    return _chunk_frame(_pandas().read_excel(source, engine="openpyxl"), chunk_size)
+
+
+def iter_upload_chunks(file: UploadFile, chunk_size: int = INGEST_CHUNK_SIZE) -> Iterator["pd.DataFrame"]:
+    """Return chunks of an uploaded CSV or Excel file."""
+    return iter_file_chunks(file.file, file.filename, chunk_size)
+
+
+# ──────────────────────────────────────────────
+#  Bulk writers
+# ──────────────────────────────────────────────
+def _cohort_suffix(cohort: str) -> str:
+    # Accounts outside the default cohort carry the cohort so the same roll number can exist in several
+    return "" if cohort == DEFAULT_COHORT else f"@{cohort}"
+
+
+def student_username(student_name: str, student_id: str, cohort: str = DEFAULT_COHORT) -> str:
+    """Login name of an auto-created student account, e.g. ``Ishaan Rao_2210A31`` or ``Ishaan Rao_2210A31@2025-B``."""
+    return f"{student_name}_{student_id}{_cohort_suffix(cohort)}"
+
+
+def _student_columns(df: "pd.DataFrame", cohort: str) -> dict:
+    """Normalise the sheet into plain column lists ready for bulk insert."""
+    names = df["Student Name"].astype(str).str.strip()
+    ids = df["Student Roll Number"].astype(str).str.strip()
+    email_tag = "" if cohort == DEFAULT_COHORT else f"+{cohort}"
+    return {
+        "student_name": names.tolist(),
+        "student_id": ids.tolist(),
+        "time_study": df["Time Studied Per Day (hrs)"].astype(float).tolist(),
+        "marks": df["Marks"].astype(float).tolist(),
+        "username": (names + "_" + ids + _cohort_suffix(cohort)).tolist(),
+        "email": (ids.str.lower() + email_tag + "@student.edu").tolist(),
+    }
+
+
+def _log_progress(rows: int, chunks: int) -> None:
+    logger.info("ingest: %d rows written (%d chunks)", rows, chunks)
+
+
+def _insert_students(db: Session, cols: dict, cohort: str, password_mode: Optional[str]) -> None:
+    """Bulk insert marks and student accounts for the given column lists."""
+    db.execute(insert(StudentMark), [
+        {"cohort": cohort, "student_id": sid, "student_name": name, "time_study": ts, "marks": mk}
+        for sid, name, ts, mk in zip(cols["student_id"], cols["student_name"], cols["time_study"], cols["marks"])
+    ])
+    passwords = provision_passwords(cols["student_id"], password_mode)
+    db.execute(insert(User), [
+        {"username": uname, "email": email, "password": pwd, "role": "student"}
+        for uname, email, pwd in zip(cols["username"], cols["email"], passwords)
+    ])
+
+
+def _link_users(db: Session, cohort: str, student_ids: Optional[list[str]] = None) -> None:
+    """
+    Link the cohort's unlinked marks (only ``student_ids`` if given) to their user by the
+    generated username, in one set-based statement (per batch of ids).
+    """
+    username = StudentMark.student_name + "_" + StudentMark.student_id + _cohort_suffix(cohort)
+    unlinked = (StudentMark.cohort == cohort, StudentMark.user_id.is_(None))
+    for batch in [None] if student_ids is None else _in_batches(student_ids):
+        where = unlinked if batch is None else (*unlinked, StudentMark.student_id.in_(batch))
+        db.execute(
+            update(StudentMark)
+            .where(*where)
+            .values(user_id=select(User.id).where(User.username == username).scalar_subquery())
+        )
+
+
+def _add_credentials(credentials: list, cols: dict) -> None:
+    room = MAX_CREDENTIALS_IN_RESPONSE - len(credentials)
+    credentials.extend(
+        {"username": uname, "password (roll number)": sid}
+        for uname, sid in zip(cols["username"][:room], cols["student_id"][:room])
+    )
+
+
+def _select_columns(cols: dict, keep: list[bool]) -> dict:
+    return {key: [v for v, k in zip(values, keep) if k] for key, values in cols.items()}
+
+
+def _last_occurrences(cols: dict) -> tuple[dict, int]:
+    """Keep only the last row of each roll number in the chunk; returns the rows and how many were dropped."""
+    last = {sid: i for i, sid in enumerate(cols["student_id"])}
+    if len(last) == len(cols["student_id"]):
+        return cols, 0
+    keep = [last[sid] == i for i, sid in enumerate(cols["student_id"])]
+    return _select_columns(cols, keep), len(cols["student_id"]) - len(last)
+
+
+def _username_owners(db: Session, usernames: list[str]) -> dict[str, int]:
+    """User id of each of ``usernames`` that is already taken."""
+    owners = {}
+    for batch in _in_batches(list(set(usernames))):
+        owners.update(db.execute(select(User.username, User.id).where(User.username.in_(batch))).all())
+    return owners
+
+
+def _in_batches(values: list, size: int = 500) -> Iterator[list]:
+    """Split ``values`` so IN (...) lists stay under SQLite's bound-parameter limit."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def replace_students(
+    db: Session,
+    data: StudentFrames,
+    cohort: str = DEFAULT_COHORT,
+    password_mode: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Replace the student marks and student accounts of ``cohort`` with the rows
+    in ``data`` (a DataFrame or an iterable of DataFrame chunks). Other cohorts
+    are not touched.
+    Each chunk is written with two bulk INSERTs and dropped before the next one
+    is parsed, so memory stays flat; marks are linked to users with a single
+    set-based UPDATE at the end. Everything runs in one transaction.
+    Passwords are provisioned according to ``password_mode`` (see
+    ``auth.PASSWORD_PROVISIONING``). ``on_progress(rows, chunks)`` is called
+    after every chunk.
+    """
+    chunks = [data] if isinstance(data, _pandas().DataFrame) else data
+    on_progress = on_progress or _log_progress
+    rows = 0
+    n_chunks = 0
+    credentials = []
+
+    try:
+        cohort_users = select(StudentMark.user_id).where(StudentMark.cohort == cohort)
+        db.execute(delete(User).where(User.id.in_(cohort_users), User.role == "student"))
+        deleted = db.execute(delete(StudentMark).where(StudentMark.cohort == cohort)).rowcount
+
+        for chunk in chunks:
+            cols = _student_columns(chunk, cohort)
+            if not cols["student_id"]:
+                continue
+            _insert_students(db, cols, cohort, password_mode)
+            _add_credentials(credentials, cols)
+            rows += len(cols["student_id"])
+            n_chunks += 1
+            on_progress(rows, n_chunks)
+
+        if rows:
+            _link_users(db, cohort)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    stats_store.invalidate(cohort)
+    principal_cache.invalidate_students(cohort)
+
+    return {
+        "rows": rows,
+        "chunks": n_chunks,
+        "inserted": rows,
+        "updated": 0,
+        "unchanged": 0,
+        "deleted": deleted,
+        "duplicates": 0,
+        "conflicts": [],
+        "credentials": credentials,
+    }
+
+
+def upsert_students(
+    db: Session,
+    data: StudentFrames,
+    delete_missing: bool = False,
+    cohort: str = DEFAULT_COHORT,
+    password_mode: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Merge the rows in ``data`` into ``cohort``, keyed on ``student_id``.
+    New roll numbers get a mark record and a student account; existing records are
+    updated only where ``student_name``/``time_study``/``marks`` changed (a rename
+    also renames the linked user). Existing accounts and password hashes are left
+    alone. With ``delete_missing`` any student of the cohort absent from the file is removed.
+    A roll number repeated in the file is applied once, last row winning, and counted
+    in ``duplicates``. Rows whose new or renamed account would take a username that
+    already belongs to another user are skipped and listed in ``conflicts`` (one
+    lookup per chunk).
+    Runs in one transaction and reports inserted/updated/unchanged/deleted counts.
+    """
+    chunks = [data] if isinstance(data, _pandas().DataFrame) else data
+    on_progress = on_progress or _log_progress
+    rows = n_chunks = inserted = updated = unchanged = deleted = duplicates = 0
+    credentials, conflicts = [], []
+    seen = set()
+
+    try:
+        for chunk in chunks:
+            cols = _student_columns(chunk, cohort)
+            if not cols["student_id"]:
+                continue
+            rows += len(cols["student_id"])
+            cols, dropped = _last_occurrences(cols)
+            duplicates += dropped
+
+            existing = {}
+            for batch in _in_batches(list(set(cols["student_id"]))):
+                for rec in db.execute(
+                    select(StudentMark.id, StudentMark.student_id, StudentMark.student_name,
+                           StudentMark.time_study, StudentMark.marks, StudentMark.user_id)
+                    .where(StudentMark.cohort == cohort, StudentMark.student_id.in_(batch))
+                ):
+                    existing[rec.student_id] = rec
+
+            # Usernames this chunk would create or rename to, checked in one lookup
+            claims = [
+                uname for sid, name, uname in zip(cols["student_id"], cols["student_name"], cols["username"])
+                if sid not in existing or (existing[sid].student_name != name and existing[sid].user_id is not None)
+            ]
+            owners = _username_owners(db, claims) if claims else {}
+
+            is_new = []
+            mark_changes, user_changes = [], []
+            for sid, name, ts, mk, uname in zip(cols["student_id"], cols["student_name"],
+                                                cols["time_study"], cols["marks"], cols["username"]):
+                rec = existing.get(sid)
+                # Rows seen in an earlier chunk exist by now; the later row updates them
+                repeated = sid in seen
+                duplicates += repeated
+                seen.add(sid)
+                renamed = rec is not None and rec.student_name != name and rec.user_id is not None
+                owner = owners.get(uname)
+                if (rec is None or renamed) and owner is not None and (rec is None or owner != rec.user_id):
+                    if len(conflicts) < MAX_CREDENTIALS_IN_RESPONSE:
+                        conflicts.append({"student_id": sid, "username": uname})
+                    is_new.append(False)
+                    continue
+                is_new.append(rec is None)
+                if rec is None:
+                    continue
+                if (rec.student_name, rec.time_study, rec.marks) == (name, ts, mk):
+                    unchanged += not repeated
+                    continue
+                mark_changes.append({"id": rec.id, "student_name": name, "time_study": ts, "marks": mk})
+                updated += not repeated
+                if renamed:
+                    user_changes.append({"id": rec.user_id, "username": uname})
+
+            if mark_changes:
+                db.execute(update(StudentMark), mark_changes)
+            if user_changes:
+                db.execute(update(User), user_changes)
+
+            new_cols = _select_columns(cols, is_new)
+            if new_cols["student_id"]:
+                _insert_students(db, new_cols, cohort, password_mode)
+                # Linked now so a later chunk repeating the roll number sees (and renames) the account
+                _link_users(db, cohort, new_cols["student_id"])
+                _add_credentials(credentials, new_cols)
+                inserted += len(new_cols["student_id"])
+
+            n_chunks += 1
+            on_progress(rows, n_chunks)
+
+        if delete_missing:
+            in_cohort = StudentMark.cohort == cohort
+            missing = [sid for sid in db.scalars(select(StudentMark.student_id).where(in_cohort)) if sid not in seen]
+            for batch in _in_batches(missing):
+                user_ids = select(StudentMark.user_id).where(in_cohort, StudentMark.student_id.in_(batch))
+                db.execute(delete(User).where(User.id.in_(user_ids), User.role == "student"))
+                db.execute(delete(StudentMark).where(in_cohort, StudentMark.student_id.in_(batch)))
+            deleted = len(missing)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    stats_store.invalidate(cohort)
+    principal_cache.invalidate_students(cohort)
+
+    return {
+        "rows": rows,
+        "chunks": n_chunks,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unchanged,
+        "deleted": deleted,
+        "duplicates": duplicates,
+        "conflicts": conflicts,
+        "credentials": credentials,
+    }
+
+
+def run_ingest(
+    db: Session,
+    data: StudentFrames,
+    mode: str = "replace",
+    delete_missing: bool = False,
+    on_progress: Optional[ProgressCallback] = None,
+    cohort: str = DEFAULT_COHORT,
+) -> dict:
+    """Dispatch to the replace or upsert writer for ``cohort`` and record throughput metrics."""
+    start = time.perf_counter()
+    if mode == "upsert":
+        result = upsert_students(db, data, delete_missing=delete_missing, cohort=cohort, on_progress=on_progress)
+    else:
+        result = replace_students(db, data, cohort=cohort, on_progress=on_progress)
+    elapsed = time.perf_counter() - start
+    ingest_rows.inc(result["rows"], mode=mode)
+    ingest_seconds.observe(elapsed, mode=mode)
+    if elapsed > 0:
+        ingest_rows_per_second.set(result["rows"] / elapsed, mode=mode)
+    return result
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Max ingest jobs running at once; further jobs wait in the queue
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "1"))
+# Finished jobs kept around for status polling
+MAX_FINISHED_JOBS = 100
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested."""
+
+
+class IngestJob:
+    """State of one background ingest, updated by the worker as it progresses."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued | running | completed | failed | cancelled
+        self.rows_processed = 0
+        self.chunks_processed = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result: Optional[dict] = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def progress(self, rows: int, chunks: int) -> None:
+        """Progress callback for the ingest engine; aborts the job if cancelled."""
+        self.rows_processed = rows
+        self.chunks_processed = chunks
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "rows_processed": self.rows_processed,
+            "chunks_processed": self.chunks_processed,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows_processed / elapsed, 1) if elapsed else 0.0,
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY, thread_name_prefix="ingest")
+_jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _run(job: IngestJob, work: Callable[[IngestJob], dict]) -> None:
+    if job.cancel_requested:
+        job.status = "cancelled"
+        job.finished_at = time.time()
+        return
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        job.result = work(job)
+        job.status = "completed"
+    except JobCancelled:
+        job.status = "cancelled"
+    except Exception as exc:
+        job.error = getattr(exc, "detail", None) or str(exc)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+
+
+def _prune() -> None:
+    finished = [job_id for job_id, job in _jobs.items() if job.finished]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def submit_job(
+    kind: str,
+    work: Callable[[IngestJob], dict],
+    on_done: Optional[Callable[[], None]] = None,
+) -> IngestJob:
+    """
+    Queue ``work(job)`` on the ingest pool and return its job handle.
+    ``on_done`` runs once the job ends, including when it is cancelled before starting.
+    """
+    job = IngestJob(kind)
+    with _lock:
+        _prune()
+        _jobs[job.id] = job
+    job.future = _executor.submit(_run, job, work)
+    if on_done is not None:
+        job.future.add_done_callback(lambda _: on_done())
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def cancel_job(job_id: str) -> Optional[IngestJob]:
+    """Request cancellation. Queued jobs never start; running jobs stop at the next chunk."""
+    job = get_job(job_id)
+    if job is None:
+        return None
+    job._cancel.set()
+    if job.future is not None and job.future.cancel():
+        job.status = "cancelled"
+        job.finished_at = time.time()
+    return job
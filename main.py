@@ -1,16 +1,48 @@
+import os
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from auth import shutdown_hash_pool
+from charts import render_pool
 from database import Base, engine
+from ingest import preload as preload_ingest
+from metrics import CONTENT_TYPE, MetricsMiddleware, render as render_metrics
+from profiling import ProfilingMiddleware
+from migrations import upgrade
 from routers import auth_router, marks_router
 
-# Create all database tables
-Base.metadata.create_all(bind=engine)
+# Import pandas in a background thread once the app is up, so the first upload
+# doesn't pay for it; set to 0 to load it only when an upload needs it
+PREWARM_IMPORTS = os.getenv("PREWARM_IMPORTS", "1") != "0"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepare the schema and warm the chart render workers on startup; stop them
+    and the password hashing workers on shutdown. Nothing heavy runs at
+    import, so workers and reloads boot fast.
+    """
+    # Create all database tables, then upgrade tables left by earlier versions
+    Base.metadata.create_all(bind=engine)
+    upgrade(engine)
+    render_pool.warm()
+    if PREWARM_IMPORTS:
+        threading.Thread(target=preload_ingest, name="prewarm", daemon=True).start()
+    yield
+    render_pool.shutdown()
+    shutdown_hash_pool()
+
 
 app = FastAPI(
     title="Student Marks Analyzer API",
     description="A FastAPI backend for analyzing student marks with JWT authentication and role-based access.",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 # Include routers
@@ -26,6 +58,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Admin-only per-request profiling (X-Profile: 1 or ?profile=1); a flag check for everyone else
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so timings cover the whole stack and the full response body
+app.add_middleware(MetricsMiddleware)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -41,15 +79,23 @@ def root():
             "3. Admin uploads CSV at /marks/upload or loads default at /marks/load-csv",
             "4. Student accounts are auto-created (username=Name_RollNo e.g. Ishaan Rao_2210A31, password=Roll Number)",
             "5. Students login and access /auth/me to see their marks",
+            "6. Pass ?cohort=<name> on uploads and queries to keep several classes or terms side by side",
         ],
         "endpoints": {
             "auth": ["/auth/register (admin)", "/auth/login", "/auth/me (student)"],
             "marks_admin": ["/marks/upload", "/marks/load-csv", "/marks/"],
-            "marks_all": ["/marks/average", "/marks/highest", "/marks/lowest", "/marks/bar-chart", "/marks/histogram"],
+            "ops": ["/metrics"],
+            "marks_all": ["/marks/cohorts", "/marks/average", "/marks/distribution", "/marks/correlation", "/marks/highest", "/marks/lowest", "/marks/top", "/marks/bottom", "/marks/bar-chart", "/marks/histogram"],
         },
     }
 
 
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint: request latency, in-flight requests, SQL, chart render and ingest metrics."""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,232 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain locked dicts keyed by label values,
+cheap enough to update on every request and every SQL statement. The ASGI
+middleware times each request per route template, and SQLAlchemy cursor events
+add statement counts and time to the request that issued them via a
+contextvar. ``render()`` produces the /metrics payload.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional, Sequence
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+INGEST_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; each label set holds per-bucket counts, sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            snapshot = [(key, list(counts), total, n) for key, (counts, total, n) in self._values.items()]
+        lines = []
+        for key, counts, total, n in snapshot:
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text format."""
+    return "\n".join(m.render() for m in _registry) + "\n"
+
+
+# ──────────────────────────────────────────────
+#  Metric definitions
+# ──────────────────────────────────────────────
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status.",
+                        ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Time to send the full response.", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being served.", ("method",))
+http_sql_statements = Histogram("http_request_sql_statements", "SQL statements issued per request.",
+                                ("method", "route"), STATEMENT_COUNT_BUCKETS)
+http_sql_seconds = Histogram("http_request_sql_seconds", "Time spent in SQL per request.", ("method", "route"))
+
+sql_statements = Counter("db_statements_total", "SQL statements executed, by engine role.", ("engine",))
+sql_latency = Histogram("db_statement_duration_seconds", "SQL statement latency, by engine role.", ("engine",))
+
+chart_render_seconds = Histogram("chart_render_seconds", "Chart render time in the worker pool, queueing included.",
+                                 ("chart",), RENDER_BUCKETS)
+
+ingest_rows = Counter("ingest_rows_total", "Rows written by uploads.", ("mode",))
+ingest_seconds = Histogram("ingest_duration_seconds", "Wall time of an ingest.", ("mode",), INGEST_BUCKETS)
+ingest_rows_per_second = Gauge("ingest_last_rows_per_second", "Throughput of the most recent ingest.", ("mode",))
+
+
+# ──────────────────────────────────────────────
+#  SQL instrumentation
+# ──────────────────────────────────────────────
+# [statements, seconds] of the request being served; None outside a request
+_request_sql: ContextVar[Optional[list]] = ContextVar("request_sql", default=None)
+
+
+def instrument_engine(sync_engine, role: str) -> None:
+    """Count and time every cursor execution on ``sync_engine`` (use ``.sync_engine`` for async engines)."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        sql_statements.inc(engine=role)
+        sql_latency.observe(elapsed, engine=role)
+        acc = _request_sql.get()
+        if acc is not None:
+            acc[0] += 1
+            acc[1] += elapsed
+
+
+# ──────────────────────────────────────────────
+#  Request middleware
+# ──────────────────────────────────────────────
+def _route_label(scope, root_path: str) -> str:
+    """Path template of the route that served ``scope``, read after routing (bounded label cardinality)."""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    # Mounts (e.g. /static) extend root_path instead of setting a route
+    mounted = scope.get("root_path", "")[len(root_path):]
+    return mounted or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: latency, status and SQL totals per route template, and
+    an in-flight gauge per method (the route is only known once routing ran).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        acc = [0, 0.0]
+        token = _request_sql.set(acc)
+        http_in_flight.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_sql.reset(token)
+            http_in_flight.dec(method=method)
+            route = _route_label(scope, root_path)
+            http_requests.inc(method=method, route=route, status=status)
+            http_latency.observe(elapsed, method=method, route=route)
+            http_sql_statements.observe(acc[0], method=method, route=route)
+            http_sql_seconds.observe(acc[1], method=method, route=route)
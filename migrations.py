@@ -0,0 +1,62 @@
+"""
+In-place schema upgrades for databases created by earlier versions.
+``create_all`` only creates missing tables, so columns and indexes added to
+existing tables are applied here. Every step is idempotent; ``upgrade`` runs on
+each start after ``create_all``.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from models import DEFAULT_COHORT, StudentMark
+
+logger = logging.getLogger(__name__)
+
+_MARK_COLUMNS = "id, student_id, student_name, time_study, marks, user_id"
+
+
+def _rebuild_student_marks_sqlite(conn: Connection, old_indexes: list[str]) -> None:
+    """SQLite cannot drop the old UNIQUE(student_id) in place, so copy into a fresh table."""
+    conn.exec_driver_sql("ALTER TABLE student_marks RENAME TO student_marks_old")
+    for name in old_indexes:
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+    StudentMark.__table__.create(conn)
+    conn.execute(
+        text(f"INSERT INTO student_marks (cohort, {_MARK_COLUMNS}) SELECT :cohort, {_MARK_COLUMNS} FROM student_marks_old"),
+        {"cohort": DEFAULT_COHORT},
+    )
+    conn.exec_driver_sql("DROP TABLE student_marks_old")
+
+
+def _add_cohort_column(conn: Connection, unique_constraints: list[dict]) -> None:
+    conn.execute(text(
+        f"ALTER TABLE student_marks ADD COLUMN cohort VARCHAR NOT NULL DEFAULT '{DEFAULT_COHORT}'"
+    ))
+    for constraint in unique_constraints:
+        if constraint["column_names"] == ["student_id"] and constraint.get("name"):
+            conn.execute(text(f'ALTER TABLE student_marks DROP CONSTRAINT "{constraint["name"]}"'))
+
+
+def _migrate_student_marks_cohort(engine: Engine) -> None:
+    """Move a single-dataset student_marks table into the default cohort."""
+    inspector = inspect(engine)
+    if not inspector.has_table("student_marks"):
+        return
+    if "cohort" in {c["name"] for c in inspector.get_columns("student_marks")}:
+        return
+
+    logger.info("migrating student_marks: existing rows move to cohort %r", DEFAULT_COHORT)
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            _rebuild_student_marks_sqlite(conn, [ix["name"] for ix in inspector.get_indexes("student_marks")])
+        else:
+            _add_cohort_column(conn, inspector.get_unique_constraints("student_marks"))
+
+
+def upgrade(engine: Engine) -> None:
+    """Bring an existing database up to the current models."""
+    _migrate_student_marks_cohort(engine)
+    # Indexes added after a table already existed are not created by create_all
+    for index in StudentMark.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
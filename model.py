@@ -1,5 +1,42 @@
-import pandas as pd
+"""
+Offline analyzer for student marks files in the upload schema.
+
+The single-file helpers (``load_data``, ``calculate_average``, ...) work on a
+DataFrame. The batch mode analyzes many term files headlessly:
+
+    python model.py data/terms/ --output batch_output
+    python model.py "exports/*.csv" term3.xlsx --workers 4 --chunk-size 50000
+
+Files are processed in parallel on a process pool and read in chunks; each
+file gets ``<name>/stats.json``, ``histogram.png`` and ``bar_chart.png``. The
+combined stats in ``combined/`` are merged from per-file partial aggregates
+(count, Welford moments, extremes, fixed-bin histogram), so no file, let
+alone the whole batch, has to fit in memory.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+# Columns of the upload schema (see ingest.REQUIRED_COLUMNS)
+NAME, ROLL, MARKS, STUDY_TIME = "Student Name", "Student Roll Number", "Marks", "Time Studied Per Day (hrs)"
+REQUIRED_COLUMNS = {NAME, ROLL, MARKS, STUDY_TIME}
+
+FILE_PATTERNS = ("*.csv", "*.xlsx", "*.xls")
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_BINS = 20
+DEFAULT_RANGE = (0.0, 100.0)
+BAR_CHART_MAX_BARS = 200
 
 
 def load_data(filepath):
@@ -9,47 +46,347 @@ def load_data(filepath):
 
 
 def calculate_average(df):
-    """Calculate and return average marks, study time, and number of courses."""
-    avg_marks = df['Marks'].mean()
-    avg_study_time = df['time_study'].mean()
-    avg_courses = df['number_courses'].mean()
-    return avg_marks, avg_study_time, avg_courses
+    """Calculate and return average marks and study time per day."""
+    avg_marks = df[MARKS].mean()
+    avg_study_time = df[STUDY_TIME].mean()
+    return avg_marks, avg_study_time
 
 
 def get_highest_scorer(df):
     """Return the row with the highest marks."""
-    highest = df.loc[df['Marks'].idxmax()]
+    highest = df.loc[df[MARKS].idxmax()]
     return highest
 
 
 def get_lowest_scorer(df):
     """Return the row with the lowest marks."""
-    lowest = df.loc[df['Marks'].idxmin()]
+    lowest = df.loc[df[MARKS].idxmin()]
     return lowest
 
 
-def generate_bar_chart(df):
-    """Generate a bar chart of marks per student."""
+def generate_bar_chart(df, path="bar_chart.png"):
+    """Save a bar chart of marks per student to ``path``."""
     plt.figure(figsize=(14, 6))
-    plt.bar(range(1, len(df) + 1), df['Marks'], color='steelblue', edgecolor='black')
+    plt.bar(range(1, len(df) + 1), df[MARKS], color='steelblue', edgecolor='black')
     plt.title('Student Marks - Bar Chart', fontsize=16, fontweight='bold')
     plt.xlabel('Student Index', fontsize=12)
     plt.ylabel('Marks', fontsize=12)
     plt.xticks(range(1, len(df) + 1, 5))
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.tight_layout()
-    plt.savefig('bar_chart.png', dpi=150)
-    plt.show()
+    plt.savefig(path, dpi=150)
+    plt.close()
 
 
-def generate_histogram(df):
-    """Generate a histogram of marks distribution."""
+def generate_histogram(df, path="histogram.png"):
+    """Save a histogram of the marks distribution to ``path``."""
     plt.figure(figsize=(10, 6))
-    plt.hist(df['Marks'], bins=15, color='coral', edgecolor='black', alpha=0.85)
+    plt.hist(df[MARKS], bins=15, color='coral', edgecolor='black', alpha=0.85)
     plt.title('Marks Distribution - Histogram', fontsize=16, fontweight='bold')
     plt.xlabel('Marks', fontsize=12)
     plt.ylabel('Frequency', fontsize=12)
     plt.grid(axis='y', linestyle='--', alpha=0.7)
     plt.tight_layout()
-    plt.savefig('histogram.png', dpi=150)
-    plt.show()
+    plt.savefig(path, dpi=150)
+    plt.close()
+
+
+# ──────────────────────────────────────────────
+#  Mergeable partial aggregates
+# ──────────────────────────────────────────────
+@dataclass
+class MarksSummary:
+    """
+    Partial aggregate of any number of rows. ``add_chunk`` folds in a DataFrame
+    chunk and ``merge`` combines two summaries (Chan's parallel variance
+    update), so per-file summaries can be merged in any grouping.
+    Histogram counts use fixed edges so they add up across files.
+    """
+
+    edges: list[float]
+    students: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    sum_study_time: float = 0.0
+    highest: Optional[dict] = None
+    lowest: Optional[dict] = None
+    counts: list[int] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.edges) - 1)
+
+    def _merge_moments(self, n: int, mean: float, m2: float) -> None:
+        total = self.students + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.students * n / total
+        self.students = total
+
+    def _merge_extremes(self, highest: Optional[dict], lowest: Optional[dict]) -> None:
+        # Strict comparisons keep the earlier record on ties
+        if highest is not None and (self.highest is None or highest["marks"] > self.highest["marks"]):
+            self.highest = highest
+        if lowest is not None and (self.lowest is None or lowest["marks"] < self.lowest["marks"]):
+            self.lowest = lowest
+
+    def add_chunk(self, df: pd.DataFrame, source: str) -> None:
+        marks = df[MARKS].to_numpy(dtype=float)
+        if not marks.size:
+            return
+
+        def record(pos: int) -> dict:
+            row = df.iloc[pos]
+            return {"student_name": str(row[NAME]).strip(), "student_id": str(row[ROLL]).strip(),
+                    "marks": float(marks[pos]), "file": source}
+
+        mean = float(marks.mean())
+        self._merge_moments(marks.size, mean, float(((marks - mean) ** 2).sum()))
+        self.sum_study_time += float(df[STUDY_TIME].astype(float).sum())
+        self._merge_extremes(record(int(marks.argmax())), record(int(marks.argmin())))
+        # Out-of-range marks land in the first / last bin
+        clipped = np.clip(marks, self.edges[0], self.edges[-1])
+        self.counts = (np.asarray(self.counts) + np.histogram(clipped, bins=self.edges)[0]).tolist()
+
+    def merge(self, other: "MarksSummary") -> None:
+        if other.edges != self.edges:
+            raise ValueError("cannot merge summaries with different histogram edges")
+        if not other.students:
+            return
+        self._merge_moments(other.students, other.mean, other.m2)
+        self.sum_study_time += other.sum_study_time
+        self._merge_extremes(other.highest, other.lowest)
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def stats(self) -> dict:
+        n = self.students
+        return {
+            "students": n,
+            "average_marks": round(self.mean, 4) if n else 0.0,
+            "std_dev": round((self.m2 / (n - 1)) ** 0.5, 4) if n > 1 else 0.0,
+            "average_study_time": round(self.sum_study_time / n, 4) if n else 0.0,
+            "highest": self.highest,
+            "lowest": self.lowest,
+            "histogram": {"edges": self.edges, "counts": self.counts},
+        }
+
+
+class StudentBars:
+    """
+    Marks of consecutive students folded into at most ``max_bars`` bars of
+    min/max/mean; adjacent bars are paired (doubling the bar width) whenever
+    the limit is reached, so memory stays O(max_bars) for any file size.
+    """
+
+    def __init__(self, max_bars: int = BAR_CHART_MAX_BARS):
+        self.max_bars = max_bars - max_bars % 2
+        self.width = 1
+        self.mins: list[float] = []
+        self.maxs: list[float] = []
+        self.sums: list[float] = []
+        self.counts: list[int] = []
+
+    def _pair_up(self) -> None:
+        self.mins = [min(a, b) for a, b in zip(self.mins[::2], self.mins[1::2])]
+        self.maxs = [max(a, b) for a, b in zip(self.maxs[::2], self.maxs[1::2])]
+        self.sums = [a + b for a, b in zip(self.sums[::2], self.sums[1::2])]
+        self.counts = [a + b for a, b in zip(self.counts[::2], self.counts[1::2])]
+        self.width *= 2
+
+    def add(self, marks: np.ndarray) -> None:
+        pos = 0
+        while pos < marks.size:
+            if not self.counts or self.counts[-1] == self.width:
+                if len(self.counts) == self.max_bars:
+                    self._pair_up()
+                    continue
+                self.mins.append(float("inf"))
+                self.maxs.append(float("-inf"))
+                self.sums.append(0.0)
+                self.counts.append(0)
+            part = marks[pos:pos + self.width - self.counts[-1]]
+            self.mins[-1] = min(self.mins[-1], float(part.min()))
+            self.maxs[-1] = max(self.maxs[-1], float(part.max()))
+            self.sums[-1] += float(part.sum())
+            self.counts[-1] += part.size
+            pos += part.size
+
+
+# ──────────────────────────────────────────────
+#  Headless charts
+# ──────────────────────────────────────────────
+def _save(fig, path: str) -> None:
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def _plot_histogram(summary: MarksSummary, title: str, path: str) -> None:
+    fig, ax = plt.subplots(figsize=(10, 6))
+    edges = np.asarray(summary.edges)
+    ax.bar(edges[:-1], summary.counts, width=np.diff(edges), align="edge",
+           color="coral", edgecolor="black", alpha=0.85)
+    ax.set_title(title, fontsize=16, fontweight="bold")
+    ax.set_xlabel("Marks", fontsize=12)
+    ax.set_ylabel("Frequency", fontsize=12)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    _save(fig, path)
+
+
+def _plot_student_bars(bars: StudentBars, title: str, path: str) -> None:
+    starts = np.concatenate(([1], 1 + np.cumsum(bars.counts)[:-1]))
+    counts = np.asarray(bars.counts)
+    centers = starts + (counts - 1) / 2
+    means = np.asarray(bars.sums) / counts
+
+    fig, ax = plt.subplots(figsize=(14, 6))
+    if bars.width == 1:
+        ax.bar(centers, means, color="steelblue", edgecolor="black")
+    else:
+        ax.bar(centers, means, width=counts, color="steelblue", edgecolor="black", linewidth=0.3, label="Mean")
+        ax.vlines(centers, bars.mins, bars.maxs, color="black", linewidth=0.8, label="Min - Max")
+        ax.legend(loc="lower right")
+        title = f"{title} ({bars.width} per bar)"
+    ax.set_title(title, fontsize=16, fontweight="bold")
+    ax.set_xlabel("Student Index", fontsize=12)
+    ax.set_ylabel("Marks", fontsize=12)
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    _save(fig, path)
+
+
+def _plot_files(results: list[dict], path: str) -> None:
+    """Mean marks of each file with a lowest-highest whisker."""
+    names = [r["name"] for r in results]
+    stats = [r["stats"] for r in results]
+    positions = np.arange(len(names))
+
+    fig, ax = plt.subplots(figsize=(max(8, len(names) * 0.6), 6))
+    ax.bar(positions, [s["average_marks"] for s in stats], color="steelblue", edgecolor="black", label="Mean")
+    ax.vlines(positions, [s["lowest"]["marks"] for s in stats], [s["highest"]["marks"] for s in stats],
+              color="black", linewidth=1.2, label="Lowest - Highest")
+    ax.set_xticks(positions, names, rotation=45, ha="right")
+    ax.set_title("Marks per File", fontsize=16, fontweight="bold")
+    ax.set_ylabel("Marks", fontsize=12)
+    ax.legend(loc="lower right")
+    ax.grid(axis="y", linestyle="--", alpha=0.7)
+    _save(fig, path)
+
+
+# ──────────────────────────────────────────────
+#  Batch runner
+# ──────────────────────────────────────────────
+def iter_chunks(path: str, chunk_size: int):
+    """Validate the header, then yield row chunks. Excel has no streaming reader, so it is parsed whole."""
+    is_csv = path.lower().endswith(".csv")
+    header = pd.read_csv(path, nrows=0) if is_csv else pd.read_excel(path, engine="openpyxl", nrows=0)
+    missing = REQUIRED_COLUMNS - set(header.columns)
+    if missing:
+        raise ValueError(f"missing columns: {sorted(missing)}")
+    if is_csv:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+        return
+    df = pd.read_excel(path, engine="openpyxl")
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def analyze_file(path: str, name: str, out_dir: str, edges: list[float], chunk_size: int) -> dict:
+    """Worker: stream one file, write its stats and charts, return its mergeable summary."""
+    summary = MarksSummary(edges)
+    bars = StudentBars()
+    try:
+        for chunk in iter_chunks(path, chunk_size):
+            summary.add_chunk(chunk, path)
+            bars.add(chunk[MARKS].to_numpy(dtype=float))
+    except (OSError, ValueError, KeyError) as exc:
+        return {"file": path, "name": name, "error": str(exc)}
+    if not summary.students:
+        return {"file": path, "name": name, "error": "no rows"}
+
+    target = os.path.join(out_dir, name)
+    os.makedirs(target, exist_ok=True)
+    stats = summary.stats()
+    with open(os.path.join(target, "stats.json"), "w") as f:
+        json.dump({"file": path, **stats}, f, indent=2)
+    _plot_histogram(summary, f"Marks Distribution - {name}", os.path.join(target, "histogram.png"))
+    _plot_student_bars(bars, f"Student Marks - {name}", os.path.join(target, "bar_chart.png"))
+    return {"file": path, "name": name, "stats": stats, "summary": asdict(summary)}
+
+
+def expand_inputs(inputs: list[str]) -> list[str]:
+    """Files named by directories (their marks files), globs or plain paths, sorted and de-duplicated."""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for pattern in FILE_PATTERNS:
+                files.extend(glob.glob(os.path.join(item, pattern)))
+        else:
+            files.extend(glob.glob(item) or [item])
+    return sorted(set(files))
+
+
+def _output_names(files: list[str]) -> list[str]:
+    """Output directory per file: its stem, suffixed when two inputs share one."""
+    names, seen = [], {}
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        names.append(stem if seen[stem] == 1 else f"{stem}-{seen[stem]}")
+    return names
+
+
+def run_batch(files: list[str], out_dir: str, workers: Optional[int] = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE, bins: int = DEFAULT_BINS,
+              marks_range: tuple[float, float] = DEFAULT_RANGE) -> dict:
+    """Analyze ``files`` in parallel and write per-file and combined results under ``out_dir``."""
+    edges = np.linspace(marks_range[0], marks_range[1], bins + 1).round(6).tolist()
+    names = _output_names(files)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(analyze_file, files, names, [out_dir] * len(files),
+                                [edges] * len(files), [chunk_size] * len(files)))
+
+    analyzed = [r for r in results if "error" not in r]
+    combined = MarksSummary(edges)
+    for result in analyzed:
+        combined.merge(MarksSummary(**result.pop("summary")))
+
+    target = os.path.join(out_dir, "combined")
+    os.makedirs(target, exist_ok=True)
+    report = {
+        **combined.stats(),
+        "files": [{"file": r["file"], "name": r["name"], "students": r["stats"]["students"],
+                   "average_marks": r["stats"]["average_marks"]} for r in analyzed],
+        "failed": {r["file"]: r["error"] for r in results if "error" in r},
+    }
+    with open(os.path.join(target, "stats.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    if analyzed:
+        _plot_histogram(combined, "Marks Distribution - All Files", os.path.join(target, "histogram.png"))
+        _plot_files(analyzed, os.path.join(target, "files_chart.png"))
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless batch analysis of student marks files.")
+    parser.add_argument("inputs", nargs="+", help="directories, glob patterns or files (.csv, .xlsx)")
+    parser.add_argument("--output", default="batch_output", help="directory for per-file and combined results")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows read per chunk")
+    parser.add_argument("--bins", type=int, default=DEFAULT_BINS, help="histogram bins")
+    parser.add_argument("--range", type=float, nargs=2, default=DEFAULT_RANGE, metavar=("LOW", "HIGH"),
+                        help="histogram range of marks")
+    args = parser.parse_args()
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        sys.exit("no input files found")
+    report = run_batch(files, args.output, args.workers, args.chunk_size, args.bins, tuple(args.range))
+    print(f"{len(report['files'])} files, {report['students']} students, "
+          f"average {report['average_marks']} -> {args.output}")
+    for path, error in report["failed"].items():
+        print(f"FAILED {path}: {error}", file=sys.stderr)
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
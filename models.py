@@ -1,7 +1,10 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
+# Cohort used when an upload or query does not name one (and for data that predates cohorts)
+DEFAULT_COHORT = "default"
+
 
 class User(Base):
     __tablename__ = "users"
@@ -20,11 +23,19 @@ class StudentMark(Base):
     __tablename__ = "student_marks"
 
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(String, unique=True, nullable=False)  # e.g. "2210A31" (real roll number)
+    cohort = Column(String, nullable=False, default=DEFAULT_COHORT)  # class / term the record belongs to
+    student_id = Column(String, nullable=False)               # e.g. "2210A31" (real roll number), unique per cohort
     student_name = Column(String, nullable=False)             # real student name
     time_study = Column(Float, nullable=False)                # hours studied per day
     marks = Column(Float, nullable=False)
 
     # Link to user account
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     user = relationship("User", back_populates="marks")
+
+    # Every analytics query filters on cohort first, so its cost follows the cohort's size
+    __table_args__ = (
+        Index("uq_student_marks_cohort_student_id", "cohort", "student_id", unique=True),
+        Index("ix_student_marks_cohort_id", "cohort", "id"),
+        Index("ix_student_marks_cohort_marks", "cohort", "marks", "id"),
+    )
@@ -0,0 +1,252 @@
+"""
+Opt-in request profiling for admins.
+
+A request carrying ``X-Profile: 1`` (or ``?profile=1``) with an admin token is
+profiled: a sampler thread reads ``sys._current_frames()`` every
+``PROFILE_INTERVAL`` seconds while the request runs, and every SQL statement
+issued by the request is logged with its duration. Two files are written to
+``PROFILE_DIR``:
+
+    <id>.folded    collapsed stacks ("frame;frame;frame count"), loadable by
+                   flamegraph.pl, speedscope or inferno
+    <id>.sql.log   one line per statement: offset, duration, SQL, parameters
+
+The request's work hops between the event loop and worker threads, so every
+busy thread is sampled and each stack is rooted at its thread name; profile
+on a quiet server for clean results. The response carries ``X-Profile-Id``.
+
+Requests without the flag pay only the flag lookup: the SQL listeners are
+attached to the engines only while at least one profile is running.
+"""
+import linecache
+import os
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from auth import get_current_user
+from database import SessionLocal, async_engine, async_read_engine, engine, read_engine
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between samples
+PROFILE_HEADER = b"x-profile"
+SQL_PARAMS_MAX_CHARS = 500
+
+# Innermost frames of a thread that is waiting rather than working (runners.py: an idle uvloop loop)
+_IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"), ("runners.py", "run")}
+# Frames that block inside a C call; idle only while on the line shown (aiosqlite's worker on SimpleQueue.get)
+_IDLE_LINES = {("core.py", "_connection_worker_thread"): "tx.get()"}
+# Prefixes stripped from frame paths (longest first, so site-packages wins over the stdlib dir containing it)
+_LIB_DIRS = sorted({p for p in sys.path if p.endswith(("site-packages", "dist-packages"))}
+                   | {sysconfig.get_paths()["stdlib"]}, key=len, reverse=True)
+
+
+# ──────────────────────────────────────────────
+#  Stack sampler
+# ──────────────────────────────────────────────
+@lru_cache(maxsize=65536)
+def _frame_label(code) -> str:
+    path = code.co_filename
+    for lib in _LIB_DIRS:
+        if path.startswith(lib + os.sep):
+            path = path[len(lib) + 1:]
+            break
+    else:
+        path = os.path.relpath(path) if os.path.isabs(path) else path
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+@lru_cache(maxsize=4096)
+def _is_idle(code, lineno: int) -> bool:
+    key = (os.path.basename(code.co_filename), code.co_name)
+    if key in _IDLE_FRAMES:
+        return True
+    fragment = _IDLE_LINES.get(key)
+    return fragment is not None and fragment in linecache.getline(code.co_filename, lineno)
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(f"thread:{thread_name}")
+    return ";".join(reversed(labels))
+
+
+class StackSampler(threading.Thread):
+    """Counts the collapsed stacks of every busy thread until ``stop()``."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._halt = threading.Event()
+
+    def run(self) -> None:
+        while not self._halt.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if name == "profiler":
+                    continue
+                if _is_idle(frame.f_code, frame.f_lineno):
+                    continue
+                self.stacks[_collapse(frame, name)] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+
+# ──────────────────────────────────────────────
+#  SQL log (listeners attached only while profiling)
+# ──────────────────────────────────────────────
+# Statement log of the profiled request being served; None otherwise
+_sql_log: ContextVar[Optional[list]] = ContextVar("profile_sql_log", default=None)
+_listeners_lock = threading.Lock()
+_active_profiles = 0
+
+
+def _sync_engines() -> list:
+    engines = {}
+    for eng in (engine, read_engine, async_engine.sync_engine, async_read_engine.sync_engine):
+        engines[id(eng)] = eng
+    return list(engines.values())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _sql_log.get() is not None:
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _sql_log.get()
+    if log is not None and hasattr(context, "_profile_start"):
+        log.append((context._profile_start, time.perf_counter() - context._profile_start, statement, parameters))
+
+
+def _attach_sql_listeners() -> None:
+    global _active_profiles
+    with _listeners_lock:
+        _active_profiles += 1
+        if _active_profiles == 1:
+            for eng in _sync_engines():
+                event.listen(eng, "before_cursor_execute", _before_cursor_execute)
+                event.listen(eng, "after_cursor_execute", _after_cursor_execute)
+
+
+def _detach_sql_listeners() -> None:
+    global _active_profiles
+    with _listeners_lock:
+        _active_profiles -= 1
+        if _active_profiles == 0:
+            for eng in _sync_engines():
+                event.remove(eng, "before_cursor_execute", _before_cursor_execute)
+                event.remove(eng, "after_cursor_execute", _after_cursor_execute)
+
+
+# ──────────────────────────────────────────────
+#  Writers
+# ──────────────────────────────────────────────
+def _write_profile(profile_id: str, scope, started: float, elapsed: float, sampler: StackSampler, sql: list) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    with open(base + ".folded", "w") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".sql.log", "w") as f:
+        f.write(f"# {scope['method']} {scope['path']} {elapsed * 1000:.1f} ms, "
+                f"{len(sql)} statements, {sum(d for _, d, _, _ in sql) * 1000:.1f} ms in SQL, "
+                f"{sampler.samples} stack samples\n")
+        for start, duration, statement, parameters in sql:
+            params = repr(parameters)
+            if len(params) > SQL_PARAMS_MAX_CHARS:
+                params = params[:SQL_PARAMS_MAX_CHARS] + "..."
+            one_line = " ".join(statement.split())
+            f.write(f"+{(start - started) * 1000:9.2f} ms  {duration * 1000:8.2f} ms  {one_line}  -- {params}\n")
+
+
+# ──────────────────────────────────────────────
+#  Middleware
+# ──────────────────────────────────────────────
+def _requested(scope) -> bool:
+    """Cheap check for the opt-in flag; runs on every request."""
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0", b"false")
+    query = scope.get("query_string", b"")
+    if b"profile=" in query:
+        values = parse_qs(query.decode("latin-1")).get("profile", [])
+        return bool(values) and values[0] not in ("", "0", "false")
+    return False
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token if scheme.lower() == "bearer" and token else None
+    return None
+
+
+def _is_admin(token: str) -> bool:
+    db = SessionLocal()
+    try:
+        return get_current_user(token=token, db=db).role == "admin"
+    except HTTPException:
+        return False
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    """Profile requests that opt in with an admin token; pass everything else straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+        token = _bearer_token(scope)
+        if token is None or not await run_in_threadpool(_is_admin, token):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        sql: list = []
+        token_var = _sql_log.set(sql)
+        _attach_sql_listeners()
+        sampler = StackSampler()
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            sampler.stop()
+            _detach_sql_listeners()
+            _sql_log.reset(token_var)
+            await run_in_threadpool(_write_profile, profile_id, scope, started, elapsed, sampler, sql)
@@ -1,16 +1,24 @@
+import secrets
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
 
-from database import get_db
+from database import get_async_db, get_db
 from models import User
 from schemas import UserCreate, Token, MyMarksOut
+from stats_store import stats_store
 from auth import (
     hash_password,
     verify_password,
+    is_pending_password,
     create_access_token,
-    get_current_user,
-    get_student_user
+    get_current_user_async,
+    get_student_user,
+    Principal,
 )
 
 router = APIRouter(
@@ -59,14 +67,23 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 
 # ---------------- LOGIN ----------------
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login with username and password. For students: username=student name, password=student ID."""
-    db_user = db.query(User).filter(User.username == form_data.username).first()
-
-    if not db_user or not verify_password(form_data.password, db_user.password):
+    db_user = (await db.scalars(
+        select(User).options(joinedload(User.marks)).where(User.username == form_data.username)
+    )).first()
+
+    # Lazily provisioned student: the initial password is the roll number
+    if db_user and is_pending_password(db_user.password):
+        if db_user.marks and secrets.compare_digest(form_data.password.encode(), db_user.marks.student_id.encode()):
+            # Hashing is deliberately slow; keep it off the event loop
+            db_user.password = await run_in_threadpool(hash_password, form_data.password)
+            await db.commit()
+
+    if not db_user or not await run_in_threadpool(verify_password, form_data.password, db_user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
@@ -82,11 +99,8 @@ def login(
 
 # ---------------- ME (Common) ----------------
 @router.get("/me")
-def read_current_user(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get current user's profile and marks (if student). Accessible by all logged-in users."""
+async def read_current_user(current_user: Principal = Depends(get_current_user_async)):
+    """Get current user's profile and marks (if student), with rank and percentile within their cohort. Accessible by all logged-in users."""
     response = {
         "id": current_user.id,
         "username": current_user.username,
@@ -95,11 +109,14 @@ def read_current_user(
 
     if current_user.marks:
         m = current_user.marks
+        stats = await stats_store.get_async(m.cohort)
         response["marks_details"] = {
+            "cohort": m.cohort,
             "student_id": m.student_id,
             "student_name": m.student_name,
             "time_study": m.time_study,
-            "marks": m.marks
+            "marks": m.marks,
+            **stats.rank(m.marks),
         }
     
     return response
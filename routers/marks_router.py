@@ -1,39 +1,116 @@
-import io
+import json
 import os
-import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+import shutil
+import tempfile
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session, joinedload
+from starlette.concurrency import run_in_threadpool
+
+from auth import Principal, get_admin_user, get_current_user, get_current_user_async, principal_cache
+from charts import (
+    CHART_RETRY_AFTER_SECONDS,
+    RenderPoolBusy,
+    bar_chart_data,
+    chart_cache,
+    histogram_data,
+    render_bar_chart,
+    render_histogram,
+    render_pool,
+)
+from database import AsyncReadSessionLocal, ReadSessionLocal, SessionLocal, get_db, get_read_db
+from export import EXPORT_FORMATS, export_stream
+from ingest import (
+    INGEST_CHUNK_SIZE,
+    MAX_CREDENTIALS_IN_RESPONSE,
+    iter_csv_chunks,
+    iter_file_chunks,
+    iter_upload_chunks,
+    run_ingest,
+    student_username,
+    validate_file,
+)
+from jobs import IngestJob, cancel_job, get_job, submit_job
+from models import DEFAULT_COHORT, StudentMark, User
+from schemas import (
+    BarChartDataOut,
+    BatchItemResult,
+    BatchUpdateOut,
+    CohortOut,
+    CorrelationOut,
+    DistributionOut,
+    HistogramDataOut,
+    ScorerOut,
+    StatsOut,
+    StudentMarkBatchItem,
+    StudentMarkOut,
+    StudentMarkUpdate,
+)
+from stats_store import stats_store
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+router = APIRouter(prefix="/marks", tags=["Student Marks"])
 
-from auth import get_admin_user, get_current_user, hash_password
-from database import get_db
-from models import StudentMark, User
-from schemas import StudentMarkOut, StatsOut, ScorerOut, StudentMarkUpdate
+COHORT_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$"
 
-router = APIRouter(prefix="/marks", tags=["Student Marks"])
+
+def _cohort_for(cohort: Optional[str], current_user: Principal) -> str:
+    """Cohort a read is scoped to: the one asked for, else the student's own, else the default."""
+    if cohort is not None:
+        return cohort
+    if current_user.marks is not None:
+        return current_user.marks.cohort
+    return DEFAULT_COHORT
+
+
+def _cohort_query(write: bool = False):
+    if write:
+        return Query(DEFAULT_COHORT, pattern=COHORT_PATTERN, description="Cohort (class / term) to write to")
+    return Query(None, pattern=COHORT_PATTERN, description="Cohort to read (default: your own cohort, or 'default')")
 
 
 # ──────────────────────────────────────────────
-#  Helper: Load DataFrame from CSV or Excel
+#  Helper: run an ingest as a background job
 # ──────────────────────────────────────────────
-def _read_file(file: UploadFile) -> pd.DataFrame:
-    """Read an uploaded CSV or Excel file into a DataFrame."""
-    filename = file.filename.lower()
-    if filename.endswith(".csv"):
-        df = pd.read_csv(file.file)
-    elif filename.endswith((".xlsx", ".xls")):
-        df = pd.read_excel(file.file, engine="openpyxl")
-    else:
-        raise HTTPException(
-            status_code=400,
-            detail="Unsupported file type. Upload a .csv or .xlsx file."
+def _ingest_summary(result: dict, mode: str) -> dict:
+    """Response fields shared by synchronous and background ingests."""
+    if mode == "upsert":
+        message = (
+            f"Processed {result['rows']} records: {result['inserted']} inserted, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged, {result['deleted']} deleted, "
+            f"{result['duplicates']} duplicate rows, {len(result['conflicts'])} username conflicts skipped."
         )
-    return df
+    else:
+        message = f"Loaded {result['rows']} records. Created {result['rows']} student accounts."
+    return {
+        "message": message,
+        "inserted": result["inserted"],
+        "updated": result["updated"],
+        "unchanged": result["unchanged"],
+        "deleted": result["deleted"],
+        "duplicates": result["duplicates"],
+        "username_conflicts": result["conflicts"],
+    }
+
+
+def _submit_ingest_job(
+    kind: str, path: str, filename: str, chunk_size: int, cleanup: bool, mode: str, delete_missing: bool,
+    cohort: str,
+) -> dict:
+    """Queue an ingest of ``path`` on the background pool. Returns the 202 payload."""
+    def work(job: IngestJob) -> dict:
+        db = SessionLocal()
+        try:
+            chunks = iter_file_chunks(path, filename, chunk_size)
+            result = run_ingest(db, chunks, mode, delete_missing, on_progress=job.progress, cohort=cohort)
+        finally:
+            db.close()
+        return {**_ingest_summary(result, mode), "student_credentials": result["credentials"]}
+
+    job = submit_job(kind, work, on_done=(lambda: os.remove(path)) if cleanup else None)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/marks/jobs/{job.id}"}
 
 
 # ──────────────────────────────────────────────
@@ -41,72 +118,43 @@ def _read_file(file: UploadFile) -> pd.DataFrame:
 # ──────────────────────────────────────────────
 @router.post("/upload", response_model=dict)
 def upload_data(
+    response: Response,
     file: UploadFile = File(...),
+    chunk_size: int = Query(INGEST_CHUNK_SIZE, ge=1, description="Rows parsed and inserted per chunk"),
+    background: bool = Query(False, description="Return a job id at once and ingest on the background pool"),
+    mode: str = Query("replace", pattern="^(replace|upsert)$", description="replace: reload everything; upsert: merge by student_id"),
+    delete_missing: bool = Query(False, description="upsert only: remove students not present in the file"),
+    cohort: str = _cohort_query(write=True),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
     Admin uploads CSV/Excel file.
     Expected columns: Student Name, Student Roll Number, Marks, Time Studied Per Day (hrs)
-    - Loads student marks into the database using real names and roll numbers.
+    - Loads student marks into ``cohort`` using real names and roll numbers; other cohorts are untouched.
     - Auto-creates student user accounts (username=Student Name, password=Roll Number).
+    - CSV files are streamed in chunks of ``chunk_size`` rows, so memory stays flat.
+    - With ``mode=upsert`` only new/changed students are written and existing accounts
+      and password hashes are kept; ``delete_missing=true`` drops students not in the file.
+    - With ``background=true`` the file is validated, spooled to disk and ingested by a
+      background job; poll ``/marks/jobs/{job_id}`` for progress.
     """
-    df = _read_file(file)
-
-    # Validate required columns
-    required_cols = {"Student Name", "Student Roll Number", "Marks", "Time Studied Per Day (hrs)"}
-    if not required_cols.issubset(set(df.columns)):
-        raise HTTPException(
-            status_code=400,
-            detail=f"File must contain columns: {required_cols}. Found: {list(df.columns)}"
-        )
-
-    # Clear existing student marks and student user accounts
-    db.query(StudentMark).delete()
-    db.query(User).filter(User.role == "student").delete()
-    db.commit()
-
-    created_students = []
-
-    for idx, row in df.iterrows():
-        student_name = str(row["Student Name"]).strip()
-        student_id = str(row["Student Roll Number"]).strip()
+    if background:
+        validate_file(file.file, file.filename)
+        suffix = os.path.splitext(file.filename)[1]
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+            shutil.copyfileobj(file.file, tmp)
+        response.status_code = 202
+        return _submit_ingest_job("upload", tmp.name, file.filename, chunk_size, True, mode, delete_missing, cohort)
 
-        # Create the student marks record
-        mark_record = StudentMark(
-            student_id=student_id,
-            student_name=student_name,
-            time_study=float(row["Time Studied Per Day (hrs)"]),
-            marks=float(row["Marks"]),
-        )
-        db.add(mark_record)
-        db.flush()  # Get the mark_record.id
-
-        # Make username unique: "Student Name_RollNumber" (e.g. Ananya Gupta_2210A52)
-        username = f"{student_name}_{student_id}"
-        student_user = User(
-            username=username,
-            email=f"{student_id.lower()}@student.edu",
-            password=hash_password(student_id),
-            role="student"
-        )
-        db.add(student_user)
-        db.flush()  # Get the student_user.id
-
-        # Link mark to user
-        mark_record.user_id = student_user.id
-
-        created_students.append({
-            "username": username,
-            "password (roll number)": student_id
-        })
-
-    db.commit()
+    chunks = iter_upload_chunks(file, chunk_size)
+    result = run_ingest(db, chunks, mode, delete_missing, cohort=cohort)
 
     return {
-        "message": f"Loaded {len(df)} records. Created {len(created_students)} student accounts.",
-        "student_credentials": created_students,
-        "note": "Students login with username=<Student Name> and password=<Roll Number>"
+        **_ingest_summary(result, mode),
+        "chunks": result["chunks"],
+        "student_credentials": result["credentials"],
+        "note": f"Showing up to {MAX_CREDENTIALS_IN_RESPONSE}. Students login with username=<Student Name> and password=<Roll Number>"
     }
 
 
@@ -114,74 +162,296 @@ def upload_data(
 #  Load from default CSV (admin only, backward compat)
 # ──────────────────────────────────────────────
 @router.post("/load-csv", response_model=dict)
-def load_csv(db: Session = Depends(get_db), current_user: User = Depends(get_admin_user)):
-    """Load student_dataset_100_records.csv from project directory and auto-create student accounts."""
+def load_csv(
+    response: Response,
+    background: bool = Query(False, description="Return a job id at once and ingest on the background pool"),
+    mode: str = Query("replace", pattern="^(replace|upsert)$", description="replace: reload everything; upsert: merge by student_id"),
+    delete_missing: bool = Query(False, description="upsert only: remove students not present in the file"),
+    cohort: str = _cohort_query(write=True),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Load student_dataset_100_records.csv from project directory into ``cohort`` and auto-create student accounts."""
     csv_path = "student_dataset_100_records.csv"
     try:
-        df = pd.read_csv(csv_path)
+        chunks = iter_csv_chunks(csv_path)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"{csv_path} not found in project directory")
 
-    required_cols = {"Student Name", "Student Roll Number", "Marks", "Time Studied Per Day (hrs)"}
-    if not required_cols.issubset(set(df.columns)):
-        raise HTTPException(
-            status_code=400,
-            detail=f"CSV must contain columns: {required_cols}. Found: {list(df.columns)}"
-        )
+    if background:
+        chunks.close()
+        response.status_code = 202
+        return _submit_ingest_job("load-csv", csv_path, csv_path, INGEST_CHUNK_SIZE, False, mode, delete_missing, cohort)
 
-    # Clear existing
-    db.query(StudentMark).delete()
-    db.query(User).filter(User.role == "student").delete()
-    db.commit()
+    result = run_ingest(db, chunks, mode, delete_missing, cohort=cohort)
+
+    return {
+        **_ingest_summary(result, mode),
+        "student_credentials": result["credentials"][:5],
+        "note": "Showing first 5. Students login with username=<Student Name>, password=<Roll Number>"
+    }
 
-    created_students = []
 
-    for idx, row in df.iterrows():
-        student_name = str(row["Student Name"]).strip()
-        student_id = str(row["Student Roll Number"]).strip()
+# ──────────────────────────────────────────────
+#  Background ingest job status / cancel (Admin only)
+# ──────────────────────────────────────────────
+@router.get("/jobs/{job_id}", response_model=dict)
+def get_ingest_job(job_id: str, current_user: Principal = Depends(get_admin_user)):
+    """Report rows processed, throughput, errors and the final result of an ingest job."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-        mark_record = StudentMark(
-            student_id=student_id,
-            student_name=student_name,
-            time_study=float(row["Time Studied Per Day (hrs)"]),
-            marks=float(row["Marks"]),
-        )
-        db.add(mark_record)
-        db.flush()
-
-        username = f"{student_name}_{student_id}"
-        student_user = User(
-            username=username,
-            email=f"{student_id.lower()}@student.edu",
-            password=hash_password(student_id),
-            role="student"
-        )
-        db.add(student_user)
-        db.flush()
 
-        mark_record.user_id = student_user.id
+@router.delete("/jobs/{job_id}", response_model=dict)
+def cancel_ingest_job(job_id: str, current_user: Principal = Depends(get_admin_user)):
+    """Cancel a queued or running ingest job. A running job rolls back at its next chunk."""
+    job = cancel_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
-        created_students.append({
-            "username": username,
-            "password (roll number)": student_id
-        })
 
-    db.commit()
+# ──────────────────────────────────────────────
+#  List all records (Admin only)
+# ──────────────────────────────────────────────
+MARK_FIELDS = ("id", "student_id", "student_name", "time_study", "marks")
+NDJSON_BATCH_SIZE = 1000
 
-    return {
-        "message": f"Loaded {len(df)} records. Created {len(created_students)} student accounts.",
-        "student_credentials": created_students[:5],
-        "note": "Showing first 5. Students login with username=<Student Name>, password=<Roll Number>"
-    }
+
+def _parse_fields(fields: Optional[str]) -> list[str]:
+    """Validate a comma separated ``fields=`` projection."""
+    if not fields:
+        return list(MARK_FIELDS)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(selected) - set(MARK_FIELDS)
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {sorted(unknown)}. Allowed: {list(MARK_FIELDS)}")
+    return selected
+
+
+def _keyset_query(selected: list[str], cohort: str, order_by: str, cursor: Optional[str], limit: Optional[int]):
+    """
+    SELECT of the cohort's projected columns ordered by ``id`` or ``(marks, id)``,
+    resuming after ``cursor`` ("<id>" or "<marks>,<id>") with a keyset WHERE, never OFFSET.
+    """
+    # The sort key is always selected so the next cursor can be built
+    keys = ["id"] if order_by == "id" else ["marks", "id"]
+    columns = [getattr(StudentMark, f) for f in dict.fromkeys(selected + keys)]
+    query = select(*columns).where(StudentMark.cohort == cohort)
+    try:
+        if cursor and order_by == "id":
+            query = query.where(StudentMark.id > int(cursor))
+        elif cursor:
+            marks, row_id = cursor.split(",")
+            query = query.where(tuple_(StudentMark.marks, StudentMark.id) > (float(marks), int(row_id)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    query = query.order_by(*(getattr(StudentMark, k) for k in keys))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _cursor_for(row, order_by: str) -> str:
+    return str(row["id"]) if order_by == "id" else f"{row['marks']},{row['id']}"
+
+
+def _marks_json(query, selected: list[str], order_by: str, limit: Optional[int]) -> JSONResponse:
+    """Run the records query and serialize the response (called in the threadpool)."""
+    with ReadSessionLocal() as db:
+        rows = db.execute(query).mappings().all()
+    headers = {}
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = _cursor_for(rows[-1], order_by)
+    return JSONResponse([{f: row[f] for f in selected} for row in rows], headers=headers)
+
+
+@router.get("/", response_model=None, responses={200: {
+    "model": list[StudentMarkOut],
+    "description": "Records as a JSON array, or one JSON object per line (application/x-ndjson). "
+                   "With ``fields=`` each record has only the selected fields.",
+    "content": {"application/x-ndjson": {}},
+}})
+async def get_all_marks(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=10000, description="Page size (default: all records)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    order_by: str = Query("id", pattern="^(id|marks)$"),
+    fields: Optional[str] = Query(None, description="Comma separated subset of record fields"),
+    format: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="ndjson streams one record per line"),
+    cohort: Optional[str] = _cohort_query(),
+    current_user: Principal = Depends(get_current_user_async)
+):
+    """
+    Return the student mark records of one cohort. Accessible by all users for charts/analytics.
+    Supports keyset pagination (``limit`` + ``cursor``, ordered by ``id`` or ``marks``;
+    the next cursor is sent in the ``X-Next-Cursor`` header), a ``fields=`` projection,
+    and ``application/x-ndjson`` streaming (``format=ndjson`` or the Accept header)
+    read from a server-side cursor. A stream has no pages: it may resume after
+    ``cursor`` but does not take ``limit``.
+    """
+    selected = _parse_fields(fields)
+    ndjson = format == "ndjson" or (format is None and "application/x-ndjson" in request.headers.get("accept", ""))
+    if ndjson and limit is not None:
+        raise HTTPException(status_code=400, detail="limit is not supported with ndjson streaming; page with JSON")
+    query = _keyset_query(selected, _cohort_for(cohort, current_user), order_by, cursor, limit)
+
+    if ndjson:
+        async def stream():
+            # Own session: the request-scoped one is closed once the response starts
+            async with AsyncReadSessionLocal() as stream_db:
+                result = await stream_db.stream(query.execution_options(yield_per=NDJSON_BATCH_SIZE))
+                async for batch in result.mappings().partitions():
+                    yield "".join(json.dumps({f: row[f] for f in selected}) + "\n" for row in batch)
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    # Building and serializing a whole cohort would stall the event loop
+    return await run_in_threadpool(_marks_json, query, selected, order_by, limit)
 
 
 # ──────────────────────────────────────────────
-#  List all records (Admin only)
+#  Cohorts (Any authenticated user)
+# ──────────────────────────────────────────────
+@router.get("/cohorts", response_model=list[CohortOut])
+def get_cohorts(db: Session = Depends(get_read_db), current_user: Principal = Depends(get_current_user)):
+    """List the cohorts that hold records, with their student counts."""
+    rows = db.execute(
+        select(StudentMark.cohort, func.count()).group_by(StudentMark.cohort).order_by(StudentMark.cohort)
+    )
+    return [{"cohort": cohort, "students": students} for cohort, students in rows]
+
+
+# ──────────────────────────────────────────────
+#  Columnar bulk export (Admin only)
+# ──────────────────────────────────────────────
+@router.get("/export")
+def export_marks(
+    format: str = Query("arrow", pattern="^(arrow|parquet|csv)$"),
+    cohort: Optional[str] = Query(None, pattern=COHORT_PATTERN, description="Export one cohort (default: all)"),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """
+    Stream the marks table (all cohorts, or one) as Arrow IPC, Parquet or CSV for analytics jobs.
+    Rows are fetched in large batches straight into columnar buffers.
+    """
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        export_stream(format, cohort),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="student_marks.{extension}"'},
+    )
+
+
+# ──────────────────────────────────────────────
+#  Batch update (Admin only); declared before /{student_id}
 # ──────────────────────────────────────────────
-@router.get("/", response_model=list[StudentMarkOut])
-def get_all_marks(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Return all student mark records. Accessible by all users for charts/analytics."""
-    return db.query(StudentMark).all()
+# Items per batch; roll numbers go into one IN (...) list, within SQLite's bound-parameter limit
+MAX_BATCH_UPDATES = 500
+_UPDATE_FIELDS = ("student_name", "time_study", "marks")
+
+
+def _validate_batch(db: Session, updates: list[StudentMarkBatchItem], records: dict, cohort: str):
+    """
+    Check every item against the loaded records and each other. Returns the
+    failed results by item position and the new username of each valid rename.
+    Username collisions of all renames are checked with one query.
+    """
+    failed: dict[int, BatchItemResult] = {}
+    renames: dict[int, str] = {}
+    seen = set()
+    for i, item in enumerate(updates):
+        record = records.get(item.student_id)
+        if item.student_id in seen:
+            failed[i] = BatchItemResult(student_id=item.student_id, status="duplicate",
+                                        detail="Student appears earlier in the batch")
+        elif record is None:
+            failed[i] = BatchItemResult(student_id=item.student_id, status="not_found",
+                                        detail="Student record not found")
+        elif item.student_name is not None and record.user:
+            renames[i] = student_username(item.student_name, record.student_id, cohort)
+        seen.add(item.student_id)
+
+    owners = dict(db.execute(
+        select(User.username, User.id).where(User.username.in_(set(renames.values())))
+    ).all()) if renames else {}
+    claimed = set()
+    for i, username in list(renames.items()):
+        record = records[updates[i].student_id]
+        if owners.get(username, record.user_id) != record.user_id or username in claimed:
+            failed[i] = BatchItemResult(student_id=record.student_id, status="conflict",
+                                        detail="Generated username already exists")
+            del renames[i]
+        claimed.add(username)
+    return failed, renames
+
+
+@router.patch("/batch", response_model=BatchUpdateOut)
+def update_student_marks_batch(
+    updates: list[StudentMarkBatchItem],
+    atomic: bool = Query(True, description="Apply nothing if any item fails (otherwise apply the valid ones)"),
+    cohort: str = _cohort_query(write=True),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """
+    Update many student records of one cohort (and their linked user accounts) in a
+    single transaction. Admin only.
+    All items are validated together first: unknown or repeated roll numbers and
+    username collisions of renames are reported per item. An atomic batch with any
+    failure is rejected with 400 and nothing applied. Cached stats and principals
+    are refreshed once for the whole batch.
+    """
+    if not updates:
+        raise HTTPException(status_code=400, detail="No updates given")
+    if len(updates) > MAX_BATCH_UPDATES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_UPDATES} updates per batch")
+
+    records = {
+        r.student_id: r for r in db.scalars(
+            select(StudentMark)
+            .options(joinedload(StudentMark.user))
+            .where(StudentMark.cohort == cohort, StudentMark.student_id.in_({u.student_id for u in updates}))
+        )
+    }
+    failed, renames = _validate_batch(db, updates, records, cohort)
+    if failed and atomic:
+        results = [failed.get(i) or BatchItemResult(student_id=u.student_id, status="unchanged",
+                                                    detail="Batch rejected") for i, u in enumerate(updates)]
+        body = BatchUpdateOut(applied=False, updated=0, failed=len(failed), results=results)
+        return JSONResponse(status_code=400, content=body.model_dump())
+
+    results: list[BatchItemResult] = []
+    changes = []
+    stale_usernames = []
+    for i, item in enumerate(updates):
+        if i in failed:
+            results.append(failed[i])
+            continue
+        record = records[item.student_id]
+        values = {name: getattr(item, name) for name in _UPDATE_FIELDS if getattr(item, name) is not None}
+        if not values:
+            results.append(BatchItemResult(student_id=item.student_id, status="unchanged"))
+            continue
+        old_values = (record.marks, record.time_study)
+        for name, value in values.items():
+            setattr(record, name, value)
+        if record.user:
+            stale_usernames.append(record.user.username)
+            if i in renames:
+                record.user.username = renames[i]
+        changes.append((record.id, old_values, (record.marks, record.time_study)))
+        # Serialised before commit, which expires the loaded records
+        results.append(BatchItemResult(student_id=item.student_id, status="updated",
+                                       record=StudentMarkOut.model_validate(record)))
+
+    if changes:
+        db.commit()
+        stats_store.update_rows(changes, cohort)
+        for username in stale_usernames:
+            principal_cache.invalidate(username)
+    return BatchUpdateOut(applied=bool(changes), updated=len(changes), failed=len(failed), results=results)
 
 
 # ──────────────────────────────────────────────
@@ -191,13 +461,18 @@ def get_all_marks(db: Session = Depends(get_db), current_user: User = Depends(ge
 def update_student_mark(
     student_id: str,
     mark_update: StudentMarkUpdate,
+    cohort: str = _cohort_query(write=True),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """Update a student mark record and its linked user account. Admin only."""
-    student_record = db.query(StudentMark).filter(StudentMark.student_id == student_id).first()
+    student_record = db.query(StudentMark).filter(
+        StudentMark.cohort == cohort, StudentMark.student_id == student_id
+    ).first()
     if not student_record:
         raise HTTPException(status_code=404, detail="Student record not found")
+    old_values = (student_record.marks, student_record.time_study)
+    old_username = student_record.user.username if student_record.user else None
 
     # Update StudentMark record
     if mark_update.student_name is not None:
@@ -209,7 +484,7 @@ def update_student_mark(
 
     # If name changed, update linked User account username
     if mark_update.student_name is not None and student_record.user:
-        new_username = f"{student_record.student_name}_{student_record.student_id}"
+        new_username = student_username(student_record.student_name, student_record.student_id, cohort)
         # Check if username already exists for another user
         existing_user = db.query(User).filter(User.username == new_username, User.id != student_record.user_id).first()
         if existing_user:
@@ -218,6 +493,9 @@ def update_student_mark(
 
     db.commit()
     db.refresh(student_record)
+    stats_store.update_row(student_record.id, old_values, (student_record.marks, student_record.time_study), cohort)
+    if old_username:
+        principal_cache.invalidate(old_username)
     return student_record
 
 
@@ -225,20 +503,18 @@ def update_student_mark(
 #  Average statistics (Any authenticated user)
 # ──────────────────────────────────────────────
 @router.get("/average", response_model=StatsOut)
-def get_average(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_average(
+    cohort: Optional[str] = _cohort_query(),
+    current_user: Principal = Depends(get_current_user_async)
+):
     """Calculate and return average marks, study time, highest and lowest marks. Accessible by all users."""
-    result = db.query(
-        func.avg(StudentMark.marks).label("average_marks"),
-        func.avg(StudentMark.time_study).label("average_study_time"),
-        func.max(StudentMark.marks).label("highest_marks"),
-        func.min(StudentMark.marks).label("lowest_marks")
-    ).first()
+    stats = await stats_store.get_async(_cohort_for(cohort, current_user))
 
     return StatsOut(
-        average_marks=round(result.average_marks or 0.0, 2),
-        average_study_time=round(result.average_study_time or 0.0, 2),
-        highest_marks=round(result.highest_marks or 0.0, 2),
-        lowest_marks=round(result.lowest_marks or 0.0, 2)
+        average_marks=round(stats.average_marks, 2),
+        average_study_time=round(stats.average_study_time, 2),
+        highest_marks=round(stats.highest_marks, 2),
+        lowest_marks=round(stats.lowest_marks, 2)
     )
 
 
@@ -246,9 +522,14 @@ def get_average(db: Session = Depends(get_db), current_user: User = Depends(get_
 #  Highest scorer (Any authenticated user)
 # ──────────────────────────────────────────────
 @router.get("/highest", response_model=ScorerOut)
-def get_highest(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_highest(
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
     """Return the student with the highest marks."""
-    student = db.query(StudentMark).order_by(StudentMark.marks.desc()).first()
+    student_pk = stats_store.get(db, _cohort_for(cohort, current_user)).highest_id()
+    student = db.get(StudentMark, student_pk) if student_pk is not None else None
     if not student:
         raise HTTPException(status_code=404, detail="No records found. Load data first.")
     return student
@@ -258,65 +539,204 @@ def get_highest(db: Session = Depends(get_db), current_user: User = Depends(get_
 #  Lowest scorer (Any authenticated user)
 # ──────────────────────────────────────────────
 @router.get("/lowest", response_model=ScorerOut)
-def get_lowest(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_lowest(
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
     """Return the student with the lowest marks."""
-    student = db.query(StudentMark).order_by(StudentMark.marks.asc()).first()
+    student_pk = stats_store.get(db, _cohort_for(cohort, current_user)).lowest_id()
+    student = db.get(StudentMark, student_pk) if student_pk is not None else None
     if not student:
         raise HTTPException(status_code=404, detail="No records found. Load data first.")
     return student
 
 
 # ──────────────────────────────────────────────
-#  Bar chart (Any authenticated user)
+#  Distribution statistics (Any authenticated user)
 # ──────────────────────────────────────────────
-@router.get("/bar-chart")
-def get_bar_chart(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Generate and return a bar chart of student marks as PNG."""
-    students = db.query(StudentMark).all()
-    if not students:
+@router.get("/distribution", response_model=DistributionOut)
+def get_distribution(
+    cutoffs: list[float] = Query([40.0], description="Pass marks; repeat for several cutoffs"),
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Return quartiles, p90/p99, standard deviation and pass rates from the in-memory stats store."""
+    stats = stats_store.get(db, _cohort_for(cohort, current_user))
+    return DistributionOut(
+        count=stats.count,
+        mean=round(stats.average_marks, 2),
+        std_dev=round(stats.std_dev, 2),
+        min=stats.lowest_marks,
+        q1=round(stats.quantile(0.25), 2),
+        median=round(stats.quantile(0.5), 2),
+        q3=round(stats.quantile(0.75), 2),
+        p90=round(stats.quantile(0.9), 2),
+        p99=round(stats.quantile(0.99), 2),
+        max=stats.highest_marks,
+        pass_rates={f"{c:g}": round(stats.share_at_least(c), 2) for c in cutoffs},
+    )
+
+
+# ──────────────────────────────────────────────
+#  Study time vs marks (Any authenticated user)
+# ──────────────────────────────────────────────
+def _round(value: Optional[float], digits: int = 4) -> Optional[float]:
+    return round(value, digits) if value is not None else None
+
+
+@router.get("/correlation", response_model=CorrelationOut)
+def get_correlation(
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Return the Pearson correlation of study time and marks, the least-squares
+    fit of marks on study hours and mean marks per study-hour band, all from
+    running sums in the stats store.
+    """
+    stats = stats_store.get(db, _cohort_for(cohort, current_user))
+    fit = stats.regression()
+    return CorrelationOut(
+        count=stats.count,
+        pearson_r=_round(fit["pearson_r"]),
+        r_squared=_round(fit["r_squared"]),
+        slope=_round(fit["slope"]),
+        intercept=_round(fit["intercept"]),
+        bands=[{**band, "mean_marks": round(band["mean_marks"], 2)} for band in stats.study_bands()],
+    )
+
+
+# ──────────────────────────────────────────────
+#  Top-k / bottom-k ranking (Any authenticated user)
+# ──────────────────────────────────────────────
+def _records_in_order(db: Session, ids: list[int]) -> list[StudentMark]:
+    """Fetch records by primary key, preserving the order of ``ids``."""
+    records = {r.id: r for r in db.query(StudentMark).filter(StudentMark.id.in_(ids))} if ids else {}
+    return [records[i] for i in ids if i in records]
+
+
+@router.get("/top", response_model=list[ScorerOut])
+def get_top(
+    k: int = Query(10, ge=1, le=1000),
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Return the ``k`` highest scoring students, best first."""
+    return _records_in_order(db, stats_store.get(db, _cohort_for(cohort, current_user)).top_ids(k))
+
+
+@router.get("/bottom", response_model=list[ScorerOut])
+def get_bottom(
+    k: int = Query(10, ge=1, le=1000),
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Return the ``k`` lowest scoring students, lowest first."""
+    return _records_in_order(db, stats_store.get(db, _cohort_for(cohort, current_user)).bottom_ids(k))
+
+
+# ──────────────────────────────────────────────
+#  Statistics cache counters (Admin only)
+# ──────────────────────────────────────────────
+@router.get("/cache-stats", response_model=dict)
+def get_cache_stats(current_user: Principal = Depends(get_admin_user)):
+    """Report the statistics store version, stats/chart/principal cache counters and render pool load."""
+    return {
+        "stats": stats_store.info(),
+        "charts": chart_cache.info(),
+        "render_pool": render_pool.info(),
+        "principals": principal_cache.info(),
+    }
+
+
+# ──────────────────────────────────────────────
+#  Helper: cached chart response with ETag / 304
+# ──────────────────────────────────────────────
+async def _chart_response(request: Request, cohort: str, name: str, render) -> Response:
+    """Serve chart ``name`` of ``cohort`` from the versioned cache, answering 304 when the ETag matches."""
+    stats = await stats_store.get_async(cohort)
+    if not stats.count:
         raise HTTPException(status_code=404, detail="No records found. Load data first.")
 
-    marks = [s.marks for s in students]
-    indices = list(range(1, len(marks) + 1))
+    async def render_current() -> bytes:
+        marks = await run_in_threadpool(stats.record_order_marks)
+        return await render_pool.render(render, marks)
+
+    try:
+        png, etag = await chart_cache.get(f"{cohort}/{name}", stats.version, render_current)
+    except RenderPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Chart renderer is busy. Try again shortly.",
+            headers={"Retry-After": str(CHART_RETRY_AFTER_SECONDS)},
+        )
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
 
-    fig, ax = plt.subplots(figsize=(14, 6))
-    ax.bar(indices, marks, color="steelblue", edgecolor="black")
-    ax.set_title("Student Marks - Bar Chart", fontsize=16, fontweight="bold")
-    ax.set_xlabel("Student Index", fontsize=12)
-    ax.set_ylabel("Marks", fontsize=12)
-    ax.set_xticks(range(1, len(marks) + 1, 5))
-    ax.grid(axis="y", linestyle="--", alpha=0.7)
-    fig.tight_layout()
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=150)
-    plt.close(fig)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+# ──────────────────────────────────────────────
+#  Bar chart (Any authenticated user)
+# ──────────────────────────────────────────────
+@router.get("/bar-chart")
+async def get_bar_chart(
+    request: Request,
+    cohort: Optional[str] = _cohort_query(),
+    current_user: Principal = Depends(get_current_user_async)
+):
+    """Return a bar chart of student marks as PNG. Rendered once per data change and cached."""
+    return await _chart_response(request, _cohort_for(cohort, current_user), "bar-chart", render_bar_chart)
 
 
 # ──────────────────────────────────────────────
 #  Histogram (Any authenticated user)
 # ──────────────────────────────────────────────
 @router.get("/histogram")
-def get_histogram(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Generate and return a histogram of marks distribution as PNG."""
-    students = db.query(StudentMark).all()
-    if not students:
+async def get_histogram(
+    request: Request,
+    cohort: Optional[str] = _cohort_query(),
+    current_user: Principal = Depends(get_current_user_async)
+):
+    """Return a histogram of marks distribution as PNG. Rendered once per data change and cached."""
+    return await _chart_response(request, _cohort_for(cohort, current_user), "histogram", render_histogram)
+
+
+# ──────────────────────────────────────────────
+#  Chart data as JSON (Any authenticated user)
+# ──────────────────────────────────────────────
+@router.get("/histogram/data", response_model=HistogramDataOut)
+def get_histogram_data(
+    bins: int = Query(15, ge=1, le=1000),
+    min_marks: Optional[float] = Query(None, description="Lower edge of the first bin (default: lowest mark)"),
+    max_marks: Optional[float] = Query(None, description="Upper edge of the last bin (default: highest mark)"),
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Return histogram bin edges and counts so the client can draw the chart itself."""
+    marks = stats_store.get(db, _cohort_for(cohort, current_user)).marks_array()
+    if not marks.size:
         raise HTTPException(status_code=404, detail="No records found. Load data first.")
+    if min_marks is not None and max_marks is not None and max_marks <= min_marks:
+        raise HTTPException(status_code=400, detail="max_marks must be greater than min_marks")
+    return histogram_data(marks, bins, min_marks, max_marks)
+
 
-    marks = [s.marks for s in students]
-
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.hist(marks, bins=15, color="coral", edgecolor="black", alpha=0.85)
-    ax.set_title("Marks Distribution - Histogram", fontsize=16, fontweight="bold")
-    ax.set_xlabel("Marks", fontsize=12)
-    ax.set_ylabel("Frequency", fontsize=12)
-    ax.grid(axis="y", linestyle="--", alpha=0.7)
-    fig.tight_layout()
-
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=150)
-    plt.close(fig)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+@router.get("/bar-chart/data", response_model=BarChartDataOut)
+def get_bar_chart_data(
+    buckets: int = Query(100, ge=1, le=5000, description="Maximum number of bars"),
+    cohort: Optional[str] = _cohort_query(),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Return per-bucket min/max/mean marks in record order, from the cached statistics."""
+    marks = stats_store.get(db, _cohort_for(cohort, current_user)).record_order_marks()
+    if not marks.size:
+        raise HTTPException(status_code=404, detail="No records found. Load data first.")
+    return bar_chart_data(marks, buckets)
@@ -34,6 +34,29 @@ class StudentMarkUpdate(BaseModel):
     marks: Optional[float] = None
 
 
+class StudentMarkBatchItem(StudentMarkUpdate):
+    student_id: str
+
+
+class BatchItemResult(BaseModel):
+    student_id: str
+    status: str                   # updated | unchanged | not_found | duplicate | conflict
+    detail: Optional[str] = None
+    record: Optional[StudentMarkOut] = None
+
+
+class BatchUpdateOut(BaseModel):
+    applied: bool                 # False when an atomic batch was rejected
+    updated: int
+    failed: int
+    results: list[BatchItemResult]
+
+
+class CohortOut(BaseModel):
+    cohort: str
+    students: int
+
+
 class StatsOut(BaseModel):
     average_marks: float
     average_study_time: float
@@ -41,6 +64,36 @@ class StatsOut(BaseModel):
     lowest_marks: float
 
 
+class DistributionOut(BaseModel):
+    count: int
+    mean: float
+    std_dev: float
+    min: float
+    q1: float
+    median: float
+    q3: float
+    p90: float
+    p99: float
+    max: float
+    pass_rates: dict[str, float]   # cutoff -> % of students with marks >= cutoff
+
+
+class StudyBandOut(BaseModel):
+    min_hours: float    # inclusive
+    max_hours: float    # exclusive
+    count: int
+    mean_marks: float
+
+
+class CorrelationOut(BaseModel):
+    count: int
+    pearson_r: Optional[float]      # None when undefined (fewer than 2 students or no spread)
+    r_squared: Optional[float]
+    slope: Optional[float]          # marks per extra study hour
+    intercept: Optional[float]
+    bands: list[StudyBandOut]
+
+
 class ScorerOut(BaseModel):
     id: int
     student_id: str
@@ -58,3 +111,18 @@ class MyMarksOut(BaseModel):
     marks: float
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class HistogramDataOut(BaseModel):
+    total: int
+    edges: list[float]    # bins + 1 edges
+    counts: list[int]     # students per bin
+
+
+class BarChartDataOut(BaseModel):
+    total: int
+    bucket_size: int      # students per bucket (1 = one bar per student)
+    start: list[int]      # 1-based student index where each bucket starts
+    min: list[float]
+    max: list[float]
+    mean: list[float]
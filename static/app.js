@@ -126,15 +126,9 @@ function initDashboard() {
 
 async function loadAnalytics() {
     await fetchStats();
-    // Cache total data for charts if admin, or just the student's data context
-    const res = await fetch(`${API_BASE}/marks/`, {
-        headers: { 'Authorization': `Bearer ${state.token}` }
-    });
-    if (res.ok) {
-        state.allData = await res.json();
-        renderCharts();
-        if (state.user.role === 'admin') renderTable(state.allData);
-    }
+    // Charts use server-side aggregates; only the admin table needs the full records
+    renderCharts();
+    await fetchTableData();
 }
 
 // Sidebar Navigation
@@ -222,15 +216,28 @@ function showStudentView() {
 
 // --- Charts ---
 async function renderCharts() {
-    if (!state.allData) return;
-
-    // Update Backend Images (Authenticated Fetch)
-    const timestamp = new Date().getTime();
-    fetchAuthenticatedImage(`${API_BASE}/marks/histogram?t=${timestamp}`, 'histogram-img');
-    fetchAuthenticatedImage(`${API_BASE}/marks/bar-chart?t=${timestamp}`, 'bar-chart-img');
-
-    const marks = state.allData.map(d => d.marks);
-    const labels = state.allData.map(d => d.student_name);
+    if (!state.token) return;
+
+    // Update Backend Images (Authenticated Fetch, revalidated via ETag)
+    fetchAuthenticatedImage(`${API_BASE}/marks/histogram`, 'histogram-img');
+    fetchAuthenticatedImage(`${API_BASE}/marks/bar-chart`, 'bar-chart-img');
+
+    // Bars and distribution are aggregated server-side from the cached statistics
+    const headers = { 'Authorization': `Bearer ${state.token}` };
+    const [barRes, histRes] = await Promise.all([
+        fetch(`${API_BASE}/marks/bar-chart/data?buckets=10`, { headers }),
+        fetch(`${API_BASE}/marks/histogram/data?bins=5&min_marks=0&max_marks=100`, { headers }),
+    ]);
+    let labels = [], means = [];
+    if (barRes.ok) {
+        const bars = await barRes.json();
+        labels = bars.start.map(start => bars.bucket_size === 1
+            ? `#${start}`
+            : `#${start}-${Math.min(start + bars.bucket_size - 1, bars.total)}`);
+        means = bars.mean;
+    }
+    let binCounts = new Array(5).fill(0);
+    if (histRes.ok) binCounts = (await histRes.json()).counts;
 
     if (barChart) barChart.destroy();
     if (histChart) histChart.destroy();
@@ -239,10 +246,10 @@ async function renderCharts() {
     barChart = new Chart(ctxBar, {
         type: 'bar',
         data: {
-            labels: labels.slice(0, 10), // Top 10 for bar
+            labels: labels,
             datasets: [{
-                label: 'Student Marks',
-                data: marks.slice(0, 10),
+                label: 'Mean Marks',
+                data: means,
                 backgroundColor: '#6366f1'
             }]
         },
@@ -250,15 +257,6 @@ async function renderCharts() {
     });
 
     const ctxHist = document.getElementById('histogramChart').getContext('2d');
-    // Simple distribution grouping
-    const bins = [0, 20, 40, 60, 80, 100];
-    const binCounts = new Array(5).fill(0);
-    marks.forEach(m => {
-        for (let i = 0; i < 5; i++) {
-            if (m >= bins[i] && m < bins[i + 1]) { binCounts[i]++; break; }
-        }
-    });
-
     histChart = new Chart(ctxHist, {
         type: 'bar',
         data: {
@@ -293,19 +291,48 @@ document.getElementById('upload-csv-input').addEventListener('change', async (e)
     const file = e.target.files[0];
     if (!file) return;
 
+    e.target.value = ''; // allow re-selecting the same file
+
     const formData = new FormData();
     formData.append('file', file);
 
-    const res = await fetch(`${API_BASE}/marks/upload`, {
-        method: 'POST',
-        headers: { 'Authorization': `Bearer ${state.token}` },
-        body: formData
-    });
-
-    if (res.ok) loadFullAdminData();
-    else alert('Upload failed');
+    // Ingest runs as a background job; the request returns once the file is spooled
+    const uploadBtn = document.getElementById('upload-btn');
+    const label = uploadBtn.textContent;
+    uploadBtn.disabled = true;
+    uploadBtn.textContent = 'Uploading...';
+    try {
+        const res = await fetch(`${API_BASE}/marks/upload?background=true`, {
+            method: 'POST',
+            headers: { 'Authorization': `Bearer ${state.token}` },
+            body: formData
+        });
+        if (!res.ok) {
+            alert('Upload failed');
+            return;
+        }
+        const job = await pollIngestJob((await res.json()).status_url, uploadBtn);
+        if (job.status === 'completed') loadFullAdminData();
+        else alert(`Upload ${job.status}${job.error ? ': ' + job.error : ''}`);
+    } finally {
+        uploadBtn.disabled = false;
+        uploadBtn.textContent = label;
+    }
 });
 
+async function pollIngestJob(statusUrl, progressEl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const res = await fetch(`${API_BASE}${statusUrl}`, {
+            headers: { 'Authorization': `Bearer ${state.token}` }
+        });
+        if (!res.ok) return { status: 'failed', error: `status check returned ${res.status}` };
+        const job = await res.json();
+        if (['completed', 'failed', 'cancelled'].includes(job.status)) return job;
+        progressEl.textContent = `Importing... ${job.rows_processed} rows`;
+    }
+}
+
 // --- Edit Modal Logic ---
 window.openEditModal = (id, name, marks, time) => {
     document.getElementById('edit-id').value = id;
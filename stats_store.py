@@ -0,0 +1,362 @@
+import asyncio
+import copy
+import math
+import os
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import ReadSessionLocal
+from models import DEFAULT_COHORT, StudentMark
+
+# Width of the study-time bands in /marks/correlation
+STUDY_BAND_HOURS = float(os.getenv("STUDY_BAND_HOURS", "1"))
+
+
+class MarksStats:
+    """Aggregates over one cohort's marks for one version, built with one scan and then updated incrementally."""
+
+    def __init__(self, version: int, rows):
+        self.version = version
+        self.count = 0
+        self.sum_marks = 0.0
+        self.sum_time = 0.0
+        self.sum_time_sq = 0.0
+        self.sum_marks_sq = 0.0
+        self.sum_cross = 0.0
+        # band index -> [count, sum of marks]
+        self._bands: dict[int, list] = {}
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._by_marks: list[tuple[float, int]] = []
+        # name -> read-only array, built on first use
+        self._arrays: dict[str, np.ndarray] = {}
+        for row_id, marks, time_study in rows:
+            self._accumulate(marks, time_study)
+            self._by_marks.append((marks, row_id))
+        self._by_marks.sort()
+
+    def _accumulate(self, marks: float, time_study: float) -> None:
+        self.count += 1
+        self.sum_marks += marks
+        self.sum_time += time_study
+        self.sum_time_sq += time_study * time_study
+        self.sum_marks_sq += marks * marks
+        self.sum_cross += time_study * marks
+        band = self._bands.setdefault(math.floor(time_study / STUDY_BAND_HOURS), [0, 0.0])
+        band[0] += 1
+        band[1] += marks
+        delta = marks - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (marks - self._mean)
+
+    def _retract(self, marks: float, time_study: float) -> None:
+        self.count -= 1
+        self.sum_marks -= marks
+        self.sum_time -= time_study
+        self.sum_time_sq -= time_study * time_study
+        self.sum_marks_sq -= marks * marks
+        self.sum_cross -= time_study * marks
+        key = math.floor(time_study / STUDY_BAND_HOURS)
+        band = self._bands[key]
+        band[0] -= 1
+        band[1] -= marks
+        if band[0] == 0:
+            del self._bands[key]
+        if self.count == 0:
+            self._mean = self._m2 = 0.0
+            return
+        old_mean = self._mean
+        self._mean = (old_mean * (self.count + 1) - marks) / self.count
+        self._m2 = max(0.0, self._m2 - (marks - old_mean) * (marks - self._mean))
+
+    def copy(self) -> "MarksStats":
+        """Independent copy to patch while readers keep using this one."""
+        other = copy.copy(self)
+        other._bands = {key: band[:] for key, band in self._bands.items()}
+        other._by_marks = self._by_marks[:]
+        other._arrays = {}
+        return other
+
+    def add(self, row_id: int, marks: float, time_study: float) -> None:
+        self._accumulate(marks, time_study)
+        insort(self._by_marks, (marks, row_id))
+        self._arrays.clear()
+
+    def remove(self, row_id: int, marks: float, time_study: float) -> bool:
+        """Take a row out of the aggregates; False if no row with that id and marks is held."""
+        pos = bisect_left(self._by_marks, (marks, row_id))
+        if pos < len(self._by_marks) and self._by_marks[pos] == (marks, row_id):
+            del self._by_marks[pos]
+            self._retract(marks, time_study)
+            self._arrays.clear()
+            return True
+        return False
+
+    @property
+    def average_marks(self) -> float:
+        return self.sum_marks / self.count if self.count else 0.0
+
+    @property
+    def average_study_time(self) -> float:
+        return self.sum_time / self.count if self.count else 0.0
+
+    @property
+    def highest_marks(self) -> float:
+        return self._by_marks[-1][0] if self._by_marks else 0.0
+
+    @property
+    def lowest_marks(self) -> float:
+        return self._by_marks[0][0] if self._by_marks else 0.0
+
+    @property
+    def std_dev(self) -> float:
+        """Sample standard deviation of marks (ddof=1, as pandas)."""
+        return (self._m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Exact quantile with linear interpolation (numpy's default), O(1)."""
+        if not self._by_marks:
+            return 0.0
+        pos = q * (len(self._by_marks) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(self._by_marks) - 1)
+        return self._by_marks[lo][0] + (self._by_marks[hi][0] - self._by_marks[lo][0]) * (pos - lo)
+
+    def share_at_least(self, cutoff: float) -> float:
+        """Percentage of students with marks >= ``cutoff``."""
+        if not self._by_marks:
+            return 0.0
+        return 100 * (len(self._by_marks) - bisect_left(self._by_marks, (cutoff,))) / len(self._by_marks)
+
+    def regression(self) -> dict:
+        """
+        Pearson correlation of study time and marks and the least-squares fit
+        marks = slope * hours + intercept. Undefined values (fewer than two
+        students, or no spread in either variable) are None.
+        """
+        n = self.count
+        sxx = self.sum_time_sq - self.sum_time * self.sum_time / n if n else 0.0
+        syy = self.sum_marks_sq - self.sum_marks * self.sum_marks / n if n else 0.0
+        sxy = self.sum_cross - self.sum_time * self.sum_marks / n if n else 0.0
+        # Cancellation can leave tiny residues where the true spread is zero
+        sxx = sxx if sxx > 1e-9 * max(1.0, self.sum_time_sq) else 0.0
+        syy = syy if syy > 1e-9 * max(1.0, self.sum_marks_sq) else 0.0
+        slope = sxy / sxx if n > 1 and sxx else None
+        r = max(-1.0, min(1.0, sxy / math.sqrt(sxx * syy))) if n > 1 and sxx and syy else None
+        return {
+            "pearson_r": r,
+            "r_squared": r * r if r is not None else None,
+            "slope": slope,
+            "intercept": (self.sum_marks - slope * self.sum_time) / n if slope is not None else None,
+        }
+
+    def study_bands(self) -> list[dict]:
+        """Count and mean marks per study-time band of ``STUDY_BAND_HOURS``, lowest band first."""
+        return [
+            {
+                "min_hours": key * STUDY_BAND_HOURS,
+                "max_hours": (key + 1) * STUDY_BAND_HOURS,
+                "count": count,
+                "mean_marks": total / count,
+            }
+            for key, (count, total) in sorted(self._bands.items())
+        ]
+
+    def _cached_array(self, name: str, build) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None:
+            array = build()
+            array.flags.writeable = False
+            self._arrays[name] = array
+        return array
+
+    def marks_array(self) -> np.ndarray:
+        """All marks as a sorted, read-only float array (no table access; cached until the next change)."""
+        return self._cached_array("sorted", lambda: np.fromiter(
+            (m for m, _ in self._by_marks), dtype=float, count=len(self._by_marks)
+        ))
+
+    def record_order_marks(self) -> np.ndarray:
+        """All marks in record (id) order, read-only; cached like ``marks_array``."""
+        return self._cached_array("record_order", lambda: np.fromiter(
+            (m for m, _ in sorted(self._by_marks, key=lambda e: e[1])), dtype=float, count=len(self._by_marks)
+        ))
+
+    def highest_id(self) -> Optional[int]:
+        """Id of the top scorer (lowest id among ties)."""
+        if not self._by_marks:
+            return None
+        top = self._by_marks[-1][0]
+        return self._by_marks[bisect_left(self._by_marks, (top,))][1]
+
+    def lowest_id(self) -> Optional[int]:
+        """Id of the lowest scorer (lowest id among ties)."""
+        return self._by_marks[0][1] if self._by_marks else None
+
+    def top_ids(self, k: int) -> list[int]:
+        """Ids of the ``k`` highest scorers, best first (lower id first among ties)."""
+        if not self._by_marks or k <= 0:
+            return []
+        kth = self._by_marks[max(0, len(self._by_marks) - k)][0]
+        tail = self._by_marks[bisect_left(self._by_marks, (kth,)):]
+        tail.sort(key=lambda e: (-e[0], e[1]))
+        return [row_id for _, row_id in tail[:k]]
+
+    def bottom_ids(self, k: int) -> list[int]:
+        """Ids of the ``k`` lowest scorers, lowest first."""
+        return [row_id for _, row_id in self._by_marks[:max(0, k)]]
+
+    def rank(self, marks: float) -> dict:
+        """
+        Competition rank (1 = best) and percentile rank of a score, in O(log n).
+        Percentile counts students below plus half of those tied.
+        """
+        n = len(self._by_marks)
+        below = bisect_left(self._by_marks, (marks,))
+        not_above = bisect_right(self._by_marks, (marks, float("inf")))
+        return {
+            "rank": n - not_above + 1,
+            "out_of": n,
+            "percentile": round(100 * (below + (not_above - below) / 2) / n, 2) if n else 0.0,
+        }
+
+
+class StatsStore:
+    """Process-local, versioned MarksStats of each cohort, rebuilt on the first read after a change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[str, MarksStats] = {}
+        # Last change per cohort; cohorts not listed are at _floor (last full invalidation)
+        self._versions: dict[str, int] = {}
+        self._floor = 0
+        # Rebuilds in progress: cohort -> set when done (threads), (cohort, version) -> task (event loop)
+        self._building: dict[str, threading.Event] = {}
+        self._async_builds: dict[tuple[str, int], asyncio.Future] = {}
+        self.version = 0  # bumped on every change to any cohort
+        self.hits = 0
+        self.misses = 0
+
+    def cohort_version(self, cohort: str) -> int:
+        return self._versions.get(cohort, self._floor)
+
+    @staticmethod
+    def _scan(cohort: str):
+        return select(StudentMark.id, StudentMark.marks, StudentMark.time_study).where(StudentMark.cohort == cohort)
+
+    def _store(self, cohort: str, stats: MarksStats) -> None:
+        # Empty cohorts are not kept, so arbitrary cohort names cannot grow the store
+        if stats.count:
+            self._stats[cohort] = stats
+        else:
+            self._stats.pop(cohort, None)
+
+    def _current(self, cohort: str) -> Optional[MarksStats]:
+        stats = self._stats.get(cohort)
+        return stats if stats is not None and stats.version == self.cohort_version(cohort) else None
+
+    def get(self, db: Session, cohort: str = DEFAULT_COHORT) -> MarksStats:
+        while True:
+            with self._lock:
+                stats = self._current(cohort)
+                if stats is not None:
+                    self.hits += 1
+                    return stats
+                building = self._building.get(cohort)
+                if building is None:
+                    self.misses += 1
+                    version = self.cohort_version(cohort)
+                    building = self._building[cohort] = threading.Event()
+                    break
+            # Another thread is scanning this cohort; use its result (or retry if it went stale)
+            building.wait()
+
+        try:
+            stats = MarksStats(version, db.execute(self._scan(cohort)))
+            with self._lock:
+                if self.cohort_version(cohort) == version:
+                    self._store(cohort, stats)
+        finally:
+            with self._lock:
+                del self._building[cohort]
+            building.set()
+        return stats
+
+    def _get_with_own_session(self, cohort: str) -> MarksStats:
+        with ReadSessionLocal() as db:
+            return self.get(db, cohort)
+
+    async def get_async(self, cohort: str = DEFAULT_COHORT) -> MarksStats:
+        """``get`` for async endpoints; a miss rebuilds in the threadpool."""
+        stats = self._current(cohort)
+        if stats is not None:
+            self.hits += 1
+            return stats
+        key = (cohort, self.cohort_version(cohort))
+        build = self._async_builds.get(key)
+        if build is None:
+            build = self._async_builds[key] = asyncio.ensure_future(
+                run_in_threadpool(self._get_with_own_session, cohort)
+            )
+            build.add_done_callback(lambda _: self._async_builds.pop(key, None))
+        # Shielded: a cancelled request must not cancel the rebuild others are waiting on
+        return await asyncio.shield(build)
+
+    def invalidate(self, cohort: Optional[str] = None) -> None:
+        """Drop the stats of ``cohort``, or of every cohort when None."""
+        with self._lock:
+            self.version += 1
+            if cohort is None:
+                self._stats.clear()
+                self._versions.clear()
+                self._floor = self.version
+            else:
+                self._stats.pop(cohort, None)
+                self._versions[cohort] = self.version
+
+    def update_row(
+        self, row_id: int, old: tuple[float, float], new: tuple[float, float], cohort: str = DEFAULT_COHORT
+    ) -> None:
+        """Apply a patch to one row. ``old``/``new`` are (marks, time_study)."""
+        self.update_rows([(row_id, old, new)], cohort)
+
+    def update_rows(
+        self, changes: Iterable[tuple[int, tuple[float, float], tuple[float, float]]], cohort: str = DEFAULT_COHORT
+    ) -> None:
+        """
+        Apply ``(row_id, old, new)`` patches to rows of ``cohort`` as one change (one version bump).
+        A row missing from the stats drops them, so the next read rebuilds.
+        """
+        with self._lock:
+            self.version += 1
+            self._versions[cohort] = self.version
+            current = self._stats.get(cohort)
+            if current is None:
+                return
+            stats = current.copy()
+            for row_id, old, new in changes:
+                if not stats.remove(row_id, *old):
+                    del self._stats[cohort]
+                    return
+                stats.add(row_id, *new)
+            stats.version = self.version
+            self._stats[cohort] = stats
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loaded": bool(self._stats),
+            "rows": sum(stats.count for stats in self._stats.values()),
+            "cohorts": {cohort: stats.count for cohort, stats in self._stats.items()},
+        }
+
+
+stats_store = StatsStore()
@@ -0,0 +1,46 @@
+"""Upsert ingest against a throwaway SQLite database (run with pytest)."""
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='marks-test-')}/test.db")
+
+import pandas as pd
+from sqlalchemy import select
+
+from database import Base, SessionLocal, engine
+from ingest import replace_students, upsert_students
+from models import StudentMark, User
+
+
+def _rows(*rows):
+    return pd.DataFrame(rows, columns=["Student Name", "Student Roll Number", "Time Studied Per Day (hrs)", "Marks"])
+
+
+def setup_function():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def test_upsert_repeated_roll_number_across_chunks_renames_account():
+    with SessionLocal() as db:
+        chunks = [_rows(("New A", "N1", 2, 50)), _rows(("New B", "N1", 3, 90))]
+        result = upsert_students(db, chunks, password_mode="lazy")
+        assert (result["inserted"], result["duplicates"]) == (1, 1)
+
+        mark = db.scalars(select(StudentMark)).one()
+        assert (mark.student_name, mark.marks) == ("New B", 90)
+        assert [u.username for u in db.scalars(select(User))] == ["New B_N1"]
+        assert mark.user_id == db.scalar(select(User.id).where(User.username == "New B_N1"))
+
+        # No orphaned account left behind to collide with a later replace
+        replace_students(db, _rows(("New C", "N1", 1, 40)), password_mode="lazy")
+        assert [u.username for u in db.scalars(select(User))] == ["New C_N1"]
+
+
+def test_upsert_reports_username_conflicts():
+    with SessionLocal() as db:
+        db.add(User(username="Zed_N2", email="zed@x", password="p", role="admin"))
+        db.commit()
+        result = upsert_students(db, _rows(("Ann", "N1", 2, 50), ("Zed", "N2", 3, 60)), password_mode="lazy")
+        assert result["inserted"] == 1
+        assert result["conflicts"] == [{"student_id": "N2", "username": "Zed_N2"}]